@@ -1,25 +1,68 @@
-import json
 import requests
-import os
-from dotenv import load_dotenv
-
-# Constants - Source account
-load_dotenv()
-BASE_URL = os.getenv("BASE_URL_2")
-CLIENT_ID = os.getenv("CLIENT_ID_2")
-API_KEY = os.getenv("API_KEY_2")
-
-# Deletion Flags - Read from environment variables
-DELETE_TENANTS = os.getenv("DELETE_TENANTS", "False").lower() == "true"
-DELETE_USERS = os.getenv("DELETE_USERS", "False").lower() == "true"
-DELETE_PERMISSIONS = os.getenv("DELETE_PERMISSIONS", "False").lower() == "true"
-DELETE_ROLES = os.getenv("DELETE_ROLES", "False").lower() == "true"
-DELETE_APPLICATIONS = os.getenv("DELETE_APPLICATIONS", "False").lower() == "true"
-DELETE_PREHOOKS = os.getenv("DELETE_PREHOOKS", "False").lower() == "true"
-
-def get_vendor_token():
-    """Fetches the vendor token using CLIENT_ID and API_KEY."""
-    url = f"{BASE_URL}/auth/vendor/"
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib3.util.retry import Retry
+from utility.frontegg_client import TimeoutHTTPAdapter, get_token_exp, load_cached_token, save_cached_token
+from utility.logger import get_logger
+from utility.rate_limiter import TokenBucket
+from utility.settings import get_settings
+
+logger = get_logger(log_file='delete_account_data.log')
+
+# Constants - Destination account (the one being cleaned up)
+BASE_URL = get_settings().BASE_URL_2
+CLIENT_ID = get_settings().CLIENT_ID_2
+API_KEY = get_settings().API_KEY_2
+
+AUTH_URL = f"{BASE_URL}/auth/vendor/"
+
+# Per-item endpoints used by the delete loops, formatted with the item ID
+USER_URL = f"{BASE_URL}/identity/resources/users/v1/{{}}"
+TENANT_URL = f"{BASE_URL}/tenants/resources/tenants/v1/{{}}"
+PERMISSION_URL = f"{BASE_URL}/identity/resources/permissions/v1/{{}}"
+ROLE_URL = f"{BASE_URL}/identity/resources/roles/v1/{{}}"
+APPLICATION_URL = f"{BASE_URL}/applications/resources/applications/v1/{{}}"
+PREHOOK_URL = f"{BASE_URL}/prehooks/resources/configurations/v1/{{}}"
+PREHOOK_HEADERS = {'frontegg-environment-id': CLIENT_ID}
+
+# Number of delete requests kept in flight at once
+DELETE_WORKERS = get_settings().DELETE_WORKERS
+
+# Client-side rate limits (requests per second) per resource, shared by all delete workers
+RATE_LIMITERS = {resource: TokenBucket(qps) for resource, qps in get_settings().RATE_QPS.items()}
+
+# Shared HTTP session - keeps a pooled keep-alive connection to BASE_URL
+# instead of opening a new TCP+TLS connection for every request.
+# The pool is sized to DELETE_WORKERS so every worker keeps its own connection.
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Content-Type': 'application/json',
+    'accept': 'application/json',
+    # Brotli is not a dependency, so only ask for encodings urllib3 can always decode
+    'Accept-Encoding': 'gzip, deflate'
+})
+SESSION.mount('https://', TimeoutHTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=DELETE_WORKERS,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        raise_on_status=False,  # let raise_for_status() surface the final response
+        allowed_methods=['GET', 'DELETE', 'PUT']  # POST is not idempotent
+    )
+))
+TOKEN_REFRESH_LOCK = threading.Lock()
+
+def get_vendor_token(use_cache=True):
+    """Fetches the vendor token using CLIENT_ID and API_KEY, reusing a cached one while it is valid."""
+    cached = load_cached_token(BASE_URL, CLIENT_ID) if use_cache else None
+    if cached:
+        return cached[0]
+
+    url = AUTH_URL
     headers = {
         'accept': 'application/json',
         'content-type': 'application/json'
@@ -28,125 +71,150 @@ def get_vendor_token():
         "clientId": CLIENT_ID,
         "secret": API_KEY
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = SESSION.post(url, headers=headers, json=data)
     response.raise_for_status()
-    return response.json().get("token")
+    response_json = response.json()
+    token = response_json.get("token")
+    if token:
+        exp = get_token_exp(token) or time.time() + response_json.get("expiresIn", 3600)
+        save_cached_token(BASE_URL, CLIENT_ID, token, exp)
+    return token
+
+def refresh_token_on_401(response, *args, **kwargs):
+    """Session response hook: when the token is rejected mid-run, re-authenticate and resend the request once."""
+    request = response.request
+    if response.status_code != 401 or request.url == AUTH_URL or getattr(request, 'token_refreshed', False):
+        return response
+    with TOKEN_REFRESH_LOCK:
+        # Only the first worker to see the stale token fetches a new one
+        if SESSION.headers.get('Authorization') == request.headers.get('Authorization'):
+            logger.warning("Vendor token was rejected, re-authenticating...")
+            SESSION.headers['Authorization'] = f'Bearer {get_vendor_token(use_cache=False)}'
+    response.close()
+    retry = request.copy()
+    retry.headers['Authorization'] = SESSION.headers['Authorization']
+    retry.token_refreshed = True
+    return SESSION.send(retry, **kwargs)
+
+SESSION.hooks['response'].append(refresh_token_on_401)
+
+def iter_all_users(include_tenants=False):
+    """Yields all users page by page using the vendor token.
 
-def get_all_users(token):
-    """Fetches all users using the vendor token."""
+    Tenant memberships are only expanded when include_tenants is set; deleting
+    users needs nothing but their IDs.
+    """
     url = f"{BASE_URL}/identity/resources/users/v2"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
     params = {
         '_limit': 200,
         '_includeSubTenants': True,
-        '_include': 'tenants',
     }
-    users = []
+    if include_tenants:
+        params['_include'] = 'tenants'
+    user_count = 0
     next_url = url
     while next_url:
-        response = requests.get(next_url, headers=headers, params=params)
+        RATE_LIMITERS['users'].acquire()
+        response = SESSION.get(next_url, params=params)
         response.raise_for_status()
+        if params is not None:
+            logger.debug(f"Users page content-encoding: {response.headers.get('content-encoding', 'identity')}")
         data = response.json()
-        users.extend(data.get("items", []))
+        items = data.get("items", [])
+        user_count += len(items)
+        yield from items
         next_url = data.get("_links", {}).get("next")
         params = None  # Only pass params on the first request
-    print(f"Retrieved {len(users)} users.")
-    return users
+    logger.info(f"Retrieved {user_count} users.")
 
-def delete_user(token, user_id):
+def delete_user(user_id):
     """Deletes a user by ID using the vendor token."""
-    url = f"{BASE_URL}/identity/resources/users/v1/{user_id}"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = USER_URL.format(user_id)
     try:
-        response = requests.delete(url, headers=headers)
+        RATE_LIMITERS['users'].acquire()
+        response = SESSION.delete(url)
         response.raise_for_status()
-        print(f"Deleted user with ID: {user_id}")
+        logger.info(f"Deleted user with ID: {user_id}")
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            print(f"User with ID {user_id} not found (404), skipping...")
+        if e.response is not None and e.response.status_code == 404:
+            logger.warning(f"User with ID {user_id} not found (404), skipping...")
         else:
-            print(f"Failed to delete user with ID {user_id}: {e}")
+            logger.error(f"Failed to delete user with ID {user_id}: {e}")
 
-def get_tenant_ids(token):
+def get_tenant_ids():
     """Fetches tenant IDs using the vendor token."""
     url = f"{BASE_URL}/tenants/resources/tenants/v2"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
+    RATE_LIMITERS['tenants'].acquire()
+    response = SESSION.get(url)
     response.raise_for_status()
     return [tenant["tenantId"] for tenant in response.json().get("items", [])]
 
-def delete_tenant(token, tenant_id):
+def delete_tenant(tenant_id):
     """Deletes a tenant by ID."""
-    url = f"{BASE_URL}/tenants/resources/tenants/v1/{tenant_id}"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.delete(url, headers=headers)
+    url = TENANT_URL.format(tenant_id)
+    RATE_LIMITERS['tenants'].acquire()
+    response = SESSION.delete(url)
     response.raise_for_status()
-    print(f"Deleted tenant with ID: {tenant_id}")
+    logger.info(f"Deleted tenant with ID: {tenant_id}")
 
-def get_permissions(token):
+def get_permissions():
     """Fetches all permissions using the vendor token."""
     url = f"{BASE_URL}/identity/resources/permissions/v1"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
+    RATE_LIMITERS['permissions'].acquire()
+    response = SESSION.get(url)
     response.raise_for_status()
     return [permission["id"] for permission in response.json()]
 
-def delete_permission(token, permission_id):
+def delete_permission(permission_id):
     """Deletes a permission by ID using the vendor token."""
-    url = f"{BASE_URL}/identity/resources/permissions/v1/{permission_id}"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = PERMISSION_URL.format(permission_id)
     try:
-        response = requests.delete(url, headers=headers)
+        RATE_LIMITERS['permissions'].acquire()
+        response = SESSION.delete(url)
         response.raise_for_status()
-        print(f"Deleted permission with ID: {permission_id}")
+        logger.info(f"Deleted permission with ID: {permission_id}")
     except requests.exceptions.HTTPError as e:
-        if response.status_code == 404:
-            print(f"Permission with ID {permission_id} not found (404), skipping...")
+        if e.response is not None and e.response.status_code == 404:
+            logger.warning(f"Permission with ID {permission_id} not found (404), skipping...")
         else:
-            raise  # Re-raise other HTTP errors
+            logger.error(f"Failed to delete permission with ID {permission_id}: {e}")
+            raise  # Re-raise other HTTP errors so the run stops, as for tenants
 
-def get_roles(token):
+def get_roles():
     """Fetches all roles using the vendor token."""
     url = f"{BASE_URL}/identity/resources/roles/v2?_limit=2000"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
+    RATE_LIMITERS['roles'].acquire()
+    response = SESSION.get(url)
     response.raise_for_status()
     return [role["id"] for role in response.json().get("items", [])]
 
-def delete_role(token, role_id):
+def delete_role(role_id):
     """Deletes a role by ID using the vendor token."""
-    url = f"{BASE_URL}/identity/resources/roles/v1/{role_id}"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = ROLE_URL.format(role_id)
     try:
-        response = requests.delete(url, headers=headers)
+        RATE_LIMITERS['roles'].acquire()
+        response = SESSION.delete(url)
         response.raise_for_status()
-        print(f"Deleted role with ID: {role_id}")
+        logger.info(f"Deleted role with ID: {role_id}")
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            print(f"Role with ID {role_id} not found (404), skipping...")
+        if e.response is not None and e.response.status_code == 404:
+            logger.warning(f"Role with ID {role_id} not found (404), skipping...")
         else:
-            print(f"Failed to delete role with ID {role_id}: {e}")
+            logger.error(f"Failed to delete role with ID {role_id}: {e}")
 
-def get_applications(token):
+def get_applications():
     """Fetches all applications using the vendor token."""
     url = f"{BASE_URL}/applications/resources/applications/v1?_excludeAgents=true"
-    headers = {'Authorization': f'Bearer {token}'}
-    response = requests.get(url, headers=headers)
+    RATE_LIMITERS['applications'].acquire()
+    response = SESSION.get(url)
     response.raise_for_status()
     applications = response.json()
-    print(f"Retrieved {len(applications)} applications.")
+    logger.info(f"Retrieved {len(applications)} applications.")
     return applications
 
-def create_dummy_application(token):
+def create_dummy_application():
     """Creates a temporary dummy application to allow deletion of all other apps."""
     url = f"{BASE_URL}/applications/resources/applications/v1"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
     data = {
         "name": "Temporary Dummy App",
         "appURL": "https://dummy.example.com",
@@ -158,169 +226,150 @@ def create_dummy_application(token):
         "description": "Temporary app for deletion process"
     }
     try:
-        response = requests.post(url, headers=headers, json=data)
+        RATE_LIMITERS['applications'].acquire()
+        response = SESSION.post(url, json=data)
         response.raise_for_status()
         app_data = response.json()
-        print(f"✓ Created dummy application: {app_data.get('name')} (ID: {app_data.get('id')})")
+        logger.info(f"✓ Created dummy application: {app_data.get('name')} (ID: {app_data.get('id')})")
         return app_data
     except requests.exceptions.HTTPError as e:
-        print(f"✗ Failed to create dummy application: {e}")
+        logger.error(f"✗ Failed to create dummy application: {e}")
         return None
 
-def delete_application(token, app_id, app_name=None):
+def delete_application(app_id, app_name=None):
     """Deletes an application by ID using the vendor token."""
-    url = f"{BASE_URL}/applications/resources/applications/v1/{app_id}"
-    headers = {'Authorization': f'Bearer {token}'}
+    url = APPLICATION_URL.format(app_id)
     display_name = app_name if app_name else app_id
     try:
-        response = requests.delete(url, headers=headers)
+        RATE_LIMITERS['applications'].acquire()
+        response = SESSION.delete(url)
         response.raise_for_status()
-        print(f"✓ Deleted application: {display_name} (ID: {app_id})")
+        logger.info(f"✓ Deleted application: {display_name} (ID: {app_id})")
         return True
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            print(f"⚠ Application {display_name} not found (404), skipping...")
-        elif e.response.status_code == 400:
-            print(f"⚠ Cannot delete {display_name} - likely the default application (400)")
+        if e.response is not None and e.response.status_code == 404:
+            logger.warning(f"⚠ Application {display_name} not found (404), skipping...")
+        elif e.response is not None and e.response.status_code == 400:
+            logger.warning(f"⚠ Cannot delete {display_name} - likely the default application (400)")
         else:
-            print(f"✗ Failed to delete application {display_name}: {e}")
+            logger.error(f"✗ Failed to delete application {display_name}: {e}")
         return False
 
-def get_prehooks(token):
+def get_prehooks():
     """Fetches all prehook configurations using the vendor token."""
     url = f"{BASE_URL}/prehooks/resources/configurations/v1"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'frontegg-environment-id': CLIENT_ID
-    }
     try:
-        response = requests.get(url, headers=headers)
+        RATE_LIMITERS['prehooks'].acquire()
+        response = SESSION.get(url, headers=PREHOOK_HEADERS)
         response.raise_for_status()
         prehooks = response.json()
-        print(f"Retrieved {len(prehooks)} prehook(s).")
+        logger.info(f"Retrieved {len(prehooks)} prehook(s).")
         return prehooks
     except requests.exceptions.HTTPError as e:
-        print(f"Failed to get prehooks: {e}")
+        logger.error(f"Failed to get prehooks: {e}")
         return []
 
-def delete_prehook(token, prehook_id, prehook_name=None):
+def delete_prehook(prehook_id, prehook_name=None):
     """Deletes a prehook by ID using the vendor token."""
-    url = f"{BASE_URL}/prehooks/resources/configurations/v1/{prehook_id}"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'frontegg-environment-id': CLIENT_ID
-    }
+    url = PREHOOK_URL.format(prehook_id)
     display_name = prehook_name if prehook_name else prehook_id
     try:
-        response = requests.delete(url, headers=headers)
+        RATE_LIMITERS['prehooks'].acquire()
+        response = SESSION.delete(url, headers=PREHOOK_HEADERS)
         response.raise_for_status()
-        print(f"✓ Deleted prehook: {display_name} (ID: {prehook_id})")
+        logger.info(f"✓ Deleted prehook: {display_name} (ID: {prehook_id})")
         return True
     except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            print(f"⚠ Prehook {display_name} not found (404), skipping...")
+        if e.response is not None and e.response.status_code == 404:
+            logger.warning(f"⚠ Prehook {display_name} not found (404), skipping...")
         else:
-            print(f"✗ Failed to delete prehook {display_name}: {e}")
+            logger.error(f"✗ Failed to delete prehook {display_name}: {e}")
         return False
 
+def run_deletes(delete_func, args_list):
+    """Runs delete_func(*args) for every entry concurrently and returns the results."""
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        futures = [executor.submit(delete_func, *args) for args in args_list]
+        return [future.result() for future in as_completed(futures)]
+
 def main():
-    token = get_vendor_token()
+    settings = get_settings()
+
+    # Authenticate the shared session once; every helper reuses its headers
+    SESSION.headers['Authorization'] = f'Bearer {get_vendor_token()}'
 
     # Execute deletion processes based on flags
-    if DELETE_APPLICATIONS:
-        print("\n=== Deleting Applications ===")
-        
-        # Step 1: Create a dummy application first
-        print("Step 1: Creating dummy application to enable full deletion...")
-        dummy_app = create_dummy_application(token)
-        
-        if not dummy_app:
-            print("⚠ Warning: Could not create dummy app, some applications may not be deletable")
+    if settings.DELETE_APPLICATIONS:
+        logger.section("Deleting Applications")
         
-        # Step 2: Get all applications (including the dummy we just created)
-        print("\nStep 2: Fetching all applications...")
-        applications = get_applications(token)
+        # Step 1: Get all applications before the dummy exists, so no refetch is needed
+        logger.subsection("Step 1: Fetching all applications...")
+        applications = get_applications()
         
         if not applications:
-            print("No applications found to delete.")
+            logger.info("No applications found to delete.")
         else:
-            # Separate dummy app from others
-            dummy_app_id = dummy_app['id'] if dummy_app else None
-            apps_to_delete = []
-            
             for app in applications:
-                app_name = app.get('name', 'Unknown')
-                is_default = app.get('isDefault', False)
-                
-                # We'll delete the dummy app last
-                if app['id'] == dummy_app_id:
-                    print(f"ℹ Will delete dummy app '{app_name}' last")
-                else:
-                    apps_to_delete.append(app)
-                    if is_default:
-                        print(f"ℹ Found default application: {app_name}")
+                if app.get('isDefault', False):
+                    logger.info(f"ℹ Found default application: {app.get('name', 'Unknown')}")
             
-            # Step 3: Delete all non-dummy applications
-            print(f"\nStep 3: Deleting {len(apps_to_delete)} original applications...")
-            deleted_count = 0
-            failed_count = 0
+            # Step 2: Create a dummy application so the original default can be deleted
+            logger.subsection("Step 2: Creating dummy application to enable full deletion...")
+            dummy_app = create_dummy_application()
             
-            for app in apps_to_delete:
-                if delete_application(token, app['id'], app.get('name')):
-                    deleted_count += 1
-                else:
-                    failed_count += 1
+            if not dummy_app:
+                logger.warning("⚠ Warning: Could not create dummy app, some applications may not be deletable")
+            
+            # Step 3: Delete all original applications
+            logger.subsection(f"Step 3: Deleting {len(applications)} original applications...")
+            results = run_deletes(delete_application, [(app['id'], app.get('name')) for app in applications])
+            deleted_count = sum(1 for deleted in results if deleted)
+            failed_count = len(results) - deleted_count
             
             # Step 4: Try to delete the dummy app (this might fail if it's now the default)
             if dummy_app:
-                print("\nStep 4: Attempting to delete dummy application...")
-                if delete_application(token, dummy_app['id'], dummy_app.get('name')):
-                    deleted_count += 1
-                    print("✓ Successfully cleaned up dummy application")
+                logger.subsection("Step 4: Attempting to delete dummy application...")
+                if delete_application(dummy_app['id'], dummy_app.get('name')):
+                    logger.info("✓ Successfully cleaned up dummy application")
                 else:
-                    print("ℹ Dummy app remains (now default) - you may want to delete it manually")
+                    logger.info("ℹ Dummy app remains (now default) - you may want to delete it manually")
             
-            print(f"\n📊 Summary: Deleted {deleted_count}/{len(applications)} applications")
+            logger.info(f"📊 Summary: Deleted {deleted_count}/{len(applications)} applications")
             if failed_count > 0:
-                print(f"   ({failed_count} could not be deleted)")
+                logger.warning(f"   ({failed_count} could not be deleted)")
     
-    if DELETE_TENANTS:
-        print("\n=== Deleting Tenants ===")
-        tenant_ids = get_tenant_ids(token)
-        for tenant_id in tenant_ids:
-            delete_tenant(token, tenant_id)
-
-    if DELETE_USERS:
-        print("\n=== Deleting Users ===")
-        users = get_all_users(token)
-        for user in users:
-            delete_user(token, user["id"])
-
-    if DELETE_PERMISSIONS:
-        print("\n=== Deleting Permissions ===")
-        permissions = get_permissions(token)
-        for permission_id in permissions:
-            delete_permission(token, permission_id)
-
-    if DELETE_ROLES:
-        print("\n=== Deleting Roles ===")
-        roles = get_roles(token)
-        for role_id in roles:
-            delete_role(token, role_id)
+    if settings.DELETE_TENANTS:
+        logger.section("Deleting Tenants")
+        tenant_ids = get_tenant_ids()
+        run_deletes(delete_tenant, [(tenant_id,) for tenant_id in tenant_ids])
+
+    if settings.DELETE_USERS:
+        logger.section("Deleting Users")
+        # Collect only the IDs before deleting: pages are offset-based, so deleting
+        # while still paginating would shift later pages and skip users
+        user_ids = [user["id"] for user in iter_all_users(include_tenants=False)]
+        run_deletes(delete_user, [(user_id,) for user_id in user_ids])
+
+    if settings.DELETE_PERMISSIONS:
+        logger.section("Deleting Permissions")
+        permissions = get_permissions()
+        run_deletes(delete_permission, [(permission_id,) for permission_id in permissions])
+
+    if settings.DELETE_ROLES:
+        logger.section("Deleting Roles")
+        roles = get_roles()
+        run_deletes(delete_role, [(role_id,) for role_id in roles])
     
-    if DELETE_PREHOOKS:
-        print("\n=== Deleting Prehooks ===")
-        prehooks = get_prehooks(token)
+    if settings.DELETE_PREHOOKS:
+        logger.section("Deleting Prehooks")
+        prehooks = get_prehooks()
         if not prehooks:
-            print("No prehooks found to delete.")
+            logger.info("No prehooks found to delete.")
         else:
-            deleted_count = 0
-            for prehook in prehooks:
-                prehook_name = prehook.get('displayName', 'Unknown')
-                prehook_id = prehook.get('id')
-                if delete_prehook(token, prehook_id, prehook_name):
-                    deleted_count += 1
-            print(f"\n📊 Summary: Deleted {deleted_count}/{len(prehooks)} prehooks")
+            results = run_deletes(delete_prehook, [(prehook.get('id'), prehook.get('displayName', 'Unknown'))
+                                                   for prehook in prehooks])
+            deleted_count = sum(1 for deleted in results if deleted)
+            logger.info(f"📊 Summary: Deleted {deleted_count}/{len(prehooks)} prehooks")
 
 if __name__ == "__main__":
     main()
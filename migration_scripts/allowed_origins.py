@@ -1,14 +1,10 @@
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
-import os
-from dotenv import load_dotenv
+from utility.settings import get_settings
 
-# Load environment variables
-load_dotenv()
-
-# Migration flag
-MIGRATE_ALLOWED_ORIGINS = os.getenv("MIGRATE_ALLOWED_ORIGINS", "False").lower() == "true"
+# Number of redirect URIs added concurrently
+REDIRECT_URI_WORKERS = 8
 
 def get_vendor_details(client):
     """Fetches vendor details including allowed origins."""
@@ -20,7 +16,7 @@ def get_vendor_details(client):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
@@ -47,7 +43,7 @@ def update_allowed_origins(client, allowed_origins):
     }
     
     try:
-        response = requests.put(url, headers=headers, json=data)
+        response = client.session.put(url, headers=headers, json=data)
         if response.status_code in [200, 201]:
             return True
         else:
@@ -69,7 +65,7 @@ def get_redirect_uris(client):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             data = response.json()
             # The API returns an object with redirectUris array
@@ -103,7 +99,7 @@ def add_redirect_uri(client, redirect_uri):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = client.session.post(url, headers=headers, json=data)
         if response.status_code in [200, 201]:
             return True
         else:
@@ -119,7 +115,7 @@ def migrate_allowed_origins(source_client, destination_client):
     """Migrates allowed origins from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_ALLOWED_ORIGINS:
+    if not get_settings().MIGRATE_ALLOWED_ORIGINS:
         log_warning("Allowed origins migration is disabled (MIGRATE_ALLOWED_ORIGINS=False)")
         return
     
@@ -155,9 +151,11 @@ def migrate_allowed_origins(source_client, destination_client):
     dest_origins = dest_vendor.get('allowedOrigins', [])
     logger.info(f"  Found {len(dest_origins)} existing allowed origin(s)")
     
-    # Merge origins (keep unique)
-    merged_origins = list(set(source_origins + dest_origins))
-    new_origins_count = len(merged_origins) - len(dest_origins)
+    # Merge origins (keep unique, preserving the existing destination order)
+    dest_origins_set = set(dest_origins)
+    missing_origins = [origin for origin in dict.fromkeys(source_origins) if origin not in dest_origins_set]
+    merged_origins = list(dict.fromkeys(dest_origins)) + missing_origins
+    new_origins_count = len(missing_origins)
     
     if new_origins_count == 0:
         log_success("✓ Allowed origins already up to date")
@@ -175,7 +173,7 @@ def migrate_redirect_uris(source_client, destination_client):
     """Migrates redirect URIs from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_ALLOWED_ORIGINS:
+    if not get_settings().MIGRATE_ALLOWED_ORIGINS:
         return
     
     log_subsection("Migrating Redirect URIs")
@@ -200,14 +198,14 @@ def migrate_redirect_uris(source_client, destination_client):
         if isinstance(uri, str):
             return uri
         elif isinstance(uri, dict):
-            return uri.get('redirectUri', uri.get('uri', str(uri)))
+            # Only stringify the dict when neither key is present
+            return uri.get('redirectUri') or uri.get('uri') or str(uri)
         else:
             return str(uri)
     
     # Find missing URIs
-    source_normalized = [normalize_uri(uri) for uri in source_uris]
-    dest_normalized = [normalize_uri(uri) for uri in dest_uris]
-    missing_uris = [uri for uri in source_normalized if uri not in dest_normalized]
+    dest_normalized = set(map(normalize_uri, dest_uris))
+    missing_uris = [uri for uri in dict.fromkeys(map(normalize_uri, source_uris)) if uri not in dest_normalized]
     
     if not missing_uris:
         log_success("✓ Redirect URIs already up to date")
@@ -219,16 +217,19 @@ def migrate_redirect_uris(source_client, destination_client):
     
     logger.start_progress(len(missing_uris), "Adding redirect URIs")
     
-    for uri in missing_uris:
-        # URIs are already normalized to strings
-        display_uri = uri[:50] + "..." if len(uri) > 50 else uri
-        logger.update_progress(description=f"Adding: {display_uri}")
-        
-        if add_redirect_uri(destination_client, uri):
-            success_count += 1
-            logger.debug(f"  ✓ Added: {uri}")
-        else:
-            logger.debug(f"  ✗ Failed: {uri}")
+    with ThreadPoolExecutor(max_workers=REDIRECT_URI_WORKERS) as executor:
+        futures = {executor.submit(add_redirect_uri, destination_client, uri): uri for uri in missing_uris}
+        for future in as_completed(futures):
+            # URIs are already normalized to strings
+            uri = futures[future]
+            display_uri = uri[:50] + "..." if len(uri) > 50 else uri
+            logger.update_progress(description=f"Added: {display_uri}")
+            
+            if future.result():
+                success_count += 1
+                logger.debug(f"  ✓ Added: {uri}")
+            else:
+                logger.debug(f"  ✗ Failed: {uri}")
     
     logger.stop_progress()
     
@@ -1,39 +1,79 @@
 import json
-import time
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from datetime import datetime
+from urllib.parse import urlparse
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
+from utility.rate_limiter import TokenBucket
 
-# Rate limit configuration
+# Rate limit configuration (requests per minute, and how many may be sent back to back)
 DEFAULT_RATE_LIMIT = 30
-last_request_times = {}
+DEFAULT_RATE_BURST = 5
+ID_SEGMENT = re.compile(r'/[0-9a-fA-F-]{36}(?=/|$)')
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
 
-def get_headers(client):
-    """Generate headers with the client token."""
+# Application body fields with their defaults; 'name' is required
+APPLICATION_UPDATE_FIELDS = {
+    'appURL': '',
+    'loginURL': '',
+    'accessType': 'FREE_ACCESS',
+    'isActive': True,
+    'type': 'WEB',
+    'frontendStack': 'REACT',
+}
+APPLICATION_CREATE_FIELDS = {**APPLICATION_UPDATE_FIELDS, 'isDefault': False}
+# Only sent when set on the source application
+APPLICATION_OPTIONAL_FIELDS = ('logoURL', 'description', 'metadata')
+
+# Number of applications created/deleted concurrently
+APPLICATION_WORKERS = 8
+
+@lru_cache(maxsize=4)
+def headers_for_token(token):
+    """Build the request headers once per token; callers must not mutate the result."""
     return {
-        "Authorization": f"Bearer {client.token}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
 
+def get_headers(client):
+    """Generate headers with the client token."""
+    return headers_for_token(client.token)
+
+def rate_limit_key(url):
+    """Group URLs by host and path template, e.g. .../applications/v1/:id."""
+    parsed = urlparse(url)
+    return parsed.netloc + ID_SEGMENT.sub('/:id', parsed.path)
+
+def build_application_body(app_data, fields):
+    """Build a create/update request body from source application data."""
+    body = {'name': app_data['name']}
+    body.update({key: app_data.get(key, default) for key, default in fields.items()})
+    body.update({key: app_data[key] for key in APPLICATION_OPTIONAL_FIELDS if app_data.get(key)})
+    return body
+
+def application_signature(app_data):
+    """Identify an application by the body it would be created with."""
+    return json.dumps(build_application_body(app_data, APPLICATION_CREATE_FIELDS), sort_keys=True, default=str)
+
 def enforce_rate_limit(endpoint, rate_limit=DEFAULT_RATE_LIMIT):
-    """Enforce the rate limit for a specific endpoint."""
-    interval = 60 / rate_limit
-    
-    if endpoint in last_request_times:
-        time_since_last_request = time.time() - last_request_times[endpoint]
-        if time_since_last_request < interval:
-            time.sleep(interval - time_since_last_request)
-    
-    last_request_times[endpoint] = time.time()
+    """Enforce the rate limit for the endpoint family the URL belongs to."""
+    key = rate_limit_key(endpoint)
+    with rate_limiters_lock:
+        bucket = rate_limiters.get(key)
+        if bucket is None:
+            bucket = rate_limiters[key] = TokenBucket(rate_limit / 60, DEFAULT_RATE_BURST)
+    bucket.acquire()
 
 def make_request_with_rate_limiting(method, url, client, headers=None, json_data=None):
     """Handle rate-limited requests."""
     enforce_rate_limit(url)
     try:
         response = client.session.request(method, url, headers=headers, json=json_data)
-        if response.status_code == 429:
-            log_warning("⚠ Rate limit exceeded. Retrying after delay...")
-            time.sleep(60)
-            response = client.session.request(method, url, headers=headers, json=json_data)
         response.raise_for_status()
         return response
     except Exception as e:
@@ -67,24 +107,8 @@ def create_application(client, app_data):
     headers = get_headers(client)
     
     # Prepare the request body - remove fields that shouldn't be sent in creation
-    req_body = {
-        'name': app_data['name'],
-        'appURL': app_data.get('appURL', ''),
-        'loginURL': app_data.get('loginURL', ''),
-        'accessType': app_data.get('accessType', 'FREE_ACCESS'),
-        'isActive': app_data.get('isActive', True),
-        'type': app_data.get('type', 'WEB'),
-        'frontendStack': app_data.get('frontendStack', 'REACT'),
-        'isDefault': app_data.get('isDefault', False)  # IMPORTANT: Preserve default flag
-    }
-    
-    # Add optional fields if they exist
-    if app_data.get('logoURL'):
-        req_body['logoURL'] = app_data['logoURL']
-    if app_data.get('description'):
-        req_body['description'] = app_data['description']
-    if app_data.get('metadata'):
-        req_body['metadata'] = app_data['metadata']
+    # IMPORTANT: isDefault is part of APPLICATION_CREATE_FIELDS to preserve the default flag
+    req_body = build_application_body(app_data, APPLICATION_CREATE_FIELDS)
     
     # Log if this is a default app
     if app_data.get('isDefault', False):
@@ -126,22 +150,7 @@ def update_application(client, app_id, app_data):
     headers = get_headers(client)
     
     # Prepare update body - only include fields that can be updated
-    update_body = {
-        'name': app_data['name'],
-        'appURL': app_data.get('appURL', ''),
-        'loginURL': app_data.get('loginURL', ''),
-        'accessType': app_data.get('accessType', 'FREE_ACCESS'),
-        'isActive': app_data.get('isActive', True),
-        'type': app_data.get('type', 'WEB'),
-        'frontendStack': app_data.get('frontendStack', 'REACT')
-    }
-    
-    if app_data.get('logoURL'):
-        update_body['logoURL'] = app_data['logoURL']
-    if app_data.get('description'):
-        update_body['description'] = app_data['description']
-    if app_data.get('metadata'):
-        update_body['metadata'] = app_data['metadata']
+    update_body = build_application_body(app_data, APPLICATION_UPDATE_FIELDS)
     
     try:
         response = make_request_with_rate_limiting('PUT', endpoint, client, headers=headers, json_data=update_body)
@@ -163,80 +172,116 @@ def migrate_applications(source_client, destination_client):
         return
     
     # Separate default and non-default applications
-    source_default_app = None
-    non_default_apps = []
+    default_apps = [app for app in source_applications if app.get('isDefault', False)]
+    non_default_apps = [app for app in source_applications if not app.get('isDefault', False)]
     
-    for app in source_applications:
-        if app.get('isDefault', False):
-            source_default_app = app
-            logger.info(f"Found source default application: {app.get('name', 'Unknown')}")
-        else:
-            non_default_apps.append(app)
+    source_default_app = default_apps[0] if default_apps else None
+    if len(default_apps) > 1:
+        log_warning(f"⚠ {len(default_apps)} default applications found in source; using the first and skipping the others: "
+                    f"{', '.join(app.get('name', 'Unknown') for app in default_apps[1:])}")
+    if source_default_app:
+        logger.info(f"Found source default application: {source_default_app.get('name', 'Unknown')}")
     
     # Fetch existing applications from destination
     log_subsection("Analyzing Destination Applications")
     dest_applications = get_applications(destination_client)
-    dest_default_app = None
+    dest_default_app = next((app for app in dest_applications if app.get('isDefault', False)), None)
+    if dest_default_app:
+        logger.info(f"Found destination default application: {dest_default_app.get('name', 'Unknown')} (ID: {dest_default_app.get('id')})")
     
+    # Match source apps to identical destination apps so re-runs only touch what changed
+    dest_by_signature = defaultdict(list)
     for app in dest_applications:
-        if app.get('isDefault', False):
-            dest_default_app = app
-            logger.info(f"Found destination default application: {app.get('name', 'Unknown')} (ID: {app.get('id')})")
-            break
+        dest_by_signature[application_signature(app)].append(app)
+    
+    kept_dest_ids = set()
+    apps_to_create = []
+    for app in non_default_apps:
+        matches = dest_by_signature.get(application_signature(app))
+        if matches:
+            kept_dest_ids.add(matches.pop()['id'])
+        else:
+            apps_to_create.append(app)
+    
+    default_up_to_date = False
+    if source_default_app:
+        matches = dest_by_signature.get(application_signature(source_default_app))
+        if matches:
+            kept_dest_ids.add(matches.pop()['id'])
+            default_up_to_date = True
+    
+    apps_to_delete = [app for app in dest_applications if app['id'] not in kept_dest_ids]
+    unchanged_count = len(kept_dest_ids)
     
     # Display migration plan
     logger.print_summary([
         f"Source applications: {len(source_applications)} ({len(non_default_apps)} non-default, {'1 default' if source_default_app else 'no default'})",
-        f"Destination applications to remove: {len(dest_applications)}",
-        f"Step 1: Migrate {len(non_default_apps)} non-default apps from source",
-        f"Step 2: Delete ALL {len(dest_applications)} destination apps",
-        f"Step 3: Migrate source default app"
+        f"Already identical in destination: {unchanged_count}",
+        f"Step 1: Migrate {len(apps_to_create)} non-default apps from source",
+        f"Step 2: Delete {len(apps_to_delete)} outdated destination apps",
+        f"Step 3: Migrate source default app" + (" (already up to date)" if default_up_to_date else "")
     ], "Migration Plan")
     
     created_count = 0
     failed_count = 0
     
-    # Step 1: Migrate all non-default applications
-    if non_default_apps:
+    # Step 1: Migrate non-default applications missing from the destination
+    if apps_to_create:
         log_subsection("Step 1: Migrating Non-Default Applications")
-        progress, task = logger.start_progress(len(non_default_apps), "Creating non-default applications")
+        progress, task = logger.start_progress(len(apps_to_create), "Creating non-default applications")
         
-        for app in non_default_apps:
-            app_name = app.get('name', 'Unknown')
-            logger.update_progress(1, f"Creating: {app_name}")
-            
-            result = create_application(destination_client, app)
-            if result:
-                created_count += 1
-            else:
-                failed_count += 1
+        with ThreadPoolExecutor(max_workers=APPLICATION_WORKERS) as executor:
+            futures = {executor.submit(create_application, destination_client, app): app for app in apps_to_create}
+            for future in as_completed(futures):
+                app_name = futures[future].get('name', 'Unknown')
+                logger.update_progress(1, f"Created: {app_name}")
+                
+                if future.result():
+                    created_count += 1
+                else:
+                    failed_count += 1
         
         logger.stop_progress()
         
         logger.print_stats("Non-Default Applications Migration", {
-            "Total": len(non_default_apps),
+            "Total": len(apps_to_create),
             "Successfully Created": created_count,
             "Failed": failed_count
         })
     
-    # Step 2: Delete ALL destination applications (including any leftovers)
-    if dest_applications and source_default_app:
-        log_subsection("Step 2: Removing ALL Destination Applications")
+    # Step 2: Delete destination applications that have no identical source app
+    if apps_to_delete and source_default_app:
+        log_subsection("Step 2: Removing Outdated Destination Applications")
+        
+        deleted_count = 0
+        progress, task = logger.start_progress(len(apps_to_delete), "Deleting destination applications")
         
-        for app in dest_applications:
-            app_name = app.get('name', 'Unknown')
-            logger.info(f"Deleting destination app: {app_name}")
-            delete_success = delete_application(
-                destination_client, 
-                app['id'], 
-                app_name
-            )
-            
-            if not delete_success:
-                log_warning(f"Failed to delete {app_name}. Continuing anyway...")
+        with ThreadPoolExecutor(max_workers=APPLICATION_WORKERS) as executor:
+            futures = {
+                executor.submit(delete_application, destination_client, app['id'], app.get('name', 'Unknown')): app
+                for app in apps_to_delete
+            }
+            for future in as_completed(futures):
+                app_name = futures[future].get('name', 'Unknown')
+                logger.update_progress(1, f"Deleted: {app_name}")
+                
+                if future.result():
+                    deleted_count += 1
+                else:
+                    log_warning(f"Failed to delete {app_name}. Continuing anyway...")
+        
+        logger.stop_progress()
+        
+        logger.print_stats("Destination Applications Removal", {
+            "Total": len(apps_to_delete),
+            "Successfully Deleted": deleted_count,
+            "Failed": len(apps_to_delete) - deleted_count
+        })
     
     # Step 3: Migrate source default application
-    if source_default_app:
+    if source_default_app and default_up_to_date:
+        log_success(f"✓ Default application already up to date: {source_default_app.get('name')}")
+    elif source_default_app:
         log_subsection("Step 3: Migrating Source Default Application")
         logger.info(f"Creating default application: {source_default_app.get('name', 'Unknown')}")
         
@@ -251,9 +296,10 @@ def migrate_applications(source_client, destination_client):
     # Final summary
     logger.print_stats("Applications Migration Summary", {
         "Total Source Applications": len(source_applications),
+        "Applications Unchanged": unchanged_count,
         "Applications Created": created_count,
         "Applications Failed": failed_count,
-        "Default App Replaced": "Yes" if source_default_app else "No"
+        "Default App Replaced": "Yes" if source_default_app and not default_up_to_date else "No"
     })
     
-    log_success("✅ Applications migration completed successfully!")
\ No newline at end of file
+    log_success("✅ Applications migration completed successfully!")
@@ -1,41 +1,87 @@
 import csv
-import requests
+import hashlib
+import json
 import os
 import re
-from collections import defaultdict
-from dotenv import load_dotenv
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utility.logger import get_logger
+from utility.rate_limiter import TokenBucket
+from utility.settings import get_settings
+from utility.utils import write_private_json
 
-load_dotenv()
+# Role assignments posted concurrently, kept under the API's 30 requests per second
+ROLE_ASSIGNMENT_WORKERS = 8
+ROLE_ASSIGNMENT_LIMITER = TokenBucket(30)
 
-def call_api(method, url, params, headers):
-    print(f"Calling API: {method} {url} with headers: {headers} and params: {params}")
-    response = requests.request(method, url, params=params, headers=headers)
-    print(f"API responded with status code: {response.status_code}")
+OFFSET_PATTERN = re.compile(r'_offset=(\d+)')
+
+# Destination email -> user ID mapping is cached on disk between runs
+USERS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "frontegg_migration")
+USERS_CACHE_TTL = 3600
+
+def call_api(session, method, url, params, headers):
+    logger = get_logger()
+    logger.debug("Calling API: %s %s params=%s", method, url, params)
+    response = session.request(method, url, params=params, headers=headers)
+    logger.debug("API responded with status code: %s", response.status_code)
     return response.json()
 
 def get_users_with_pagination(client):
-    url = f"{client.base_url}/identity/resources/users/v3?includeSubTenants=true&_limit=200"
+    """Yields destination users page by page.
+
+    The next page is requested in the background while the current one is consumed.
+    """
+    base_url = f"{client.base_url}/identity/resources/users/v3?includeSubTenants=true&_limit=200"
     headers = {"authorization": f"Bearer {client.token}"}
-    print(f"Fetching users from: {url}")
-    res = call_api("GET", url, {}, headers)
-    next_page = res.get("_links", {}).get("next", "")
-    items_arr = res.get("items", [])
-    while next_page:
-        offset_match = re.search(r'_offset=(\d+)', next_page)
-        if offset_match:
-            offset_value = offset_match.group(1)
-            url = f"{client.base_url}/identity/resources/users/v3?includeSubTenants=true&_limit=200&_offset={offset_value}"
-            print(f"Fetching next page of users from: {url}")
-            next_page_res = call_api("GET", url, {}, headers)
-            items_arr.extend(next_page_res.get("items", []))
-            next_page = next_page_res.get("_links", {}).get("next", "")
-        else:
-            break
-    print("Response from /users/v3 endpoint:", res)
-    print("Retrieved users and their IDs:")
-    for user in items_arr:
-        print(f"Email: {user.get('email')}, User ID: {user.get('id')}")
-    return {"count": len(items_arr), "items": items_arr}
+    url = base_url
+    logger = get_logger()
+    logger.info("Fetching users from: %s", url)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(call_api, client.session, "GET", url, {}, headers)
+        while pending:
+            res = pending.result()
+            pending = None
+            next_page = res.get("_links", {}).get("next", "")
+            offset_match = OFFSET_PATTERN.search(next_page) if next_page else None
+            if offset_match:
+                url = f"{base_url}&_offset={offset_match.group(1)}"
+                logger.debug("Fetching next page of users from: %s", url)
+                pending = executor.submit(call_api, client.session, "GET", url, {}, headers)
+            yield from res.get("items", [])
+
+def users_cache_path(client):
+    # base_url is the shared regional API host, so the account's client ID is part of the key
+    digest = hashlib.sha1(f"{client.base_url}|{client.client_id}".encode()).hexdigest()
+    return os.path.join(USERS_CACHE_DIR, f"users_{digest}.json")
+
+def load_cached_email_mapping(client):
+    """Returns the cached email -> user ID mapping, or None if missing, stale or refresh is requested."""
+    path = users_cache_path(client)
+    if get_settings().REFRESH_USERS_CACHE:
+        return None
+    try:
+        if os.path.getmtime(path) < time.time() - USERS_CACHE_TTL:
+            return None
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def fetch_email_mapping(client):
+    """Fetches destination users and stores the email -> user ID mapping on disk."""
+    logger = get_logger()
+    email_to_userid = {
+        user.get('email').strip(): user.get('id')
+        for user in get_users_with_pagination(client) if user.get('email') and user.get('id')
+    }
+    try:
+        # Emails are PII: readable by the current user only
+        write_private_json(users_cache_path(client), email_to_userid)
+    except OSError as e:
+        logger.warning("Could not write users cache: %s", e)
+    return email_to_userid
 
 def create_role_mapping(destination_mapping_file):
     """
@@ -46,18 +92,19 @@ def create_role_mapping(destination_mapping_file):
          c3911b41-6a83-4c76-bc35-485fd94d45d0,Editor
     will map the role name "Editor" to the destination roleId.
     """
+    logger = get_logger()
     role_mapping = {}
-    print(f"Building role mapping from destination file: {destination_mapping_file}")
+    logger.info("Building role mapping from destination file: %s", destination_mapping_file)
     with open(destination_mapping_file, mode='r') as dest_file:
         csv_reader = csv.DictReader(dest_file)
-        print("Destination mapping CSV headers:", csv_reader.fieldnames)
+        logger.debug("Destination mapping CSV headers: %s", csv_reader.fieldnames)
         for row in csv_reader:
             role_name = row.get("name", "").strip()
             role_id = row.get("roleId", "").strip()
-            print(f"Mapping row: role name '{role_name}' -> destination role '{role_id}'")
+            logger.debug("Mapping row: role name '%s' -> destination role '%s'", role_name, role_id)
             if role_name and role_id:
                 role_mapping[role_name] = role_id
-    print("Final role mapping:", role_mapping)
+    logger.debug("Final role mapping: %s", role_mapping)
     return role_mapping
 
 def assign_roles_to_users(source, destination):
@@ -76,66 +123,77 @@ def assign_roles_to_users(source, destination):
     """
     source_file = 'account_data/assign_roles_to_users.csv'
     roles_mapping_file = 'account_data/roles_in_destination.csv'
-    print("Starting role assignment process...")
+    logger = get_logger()
+    logger.info("Starting role assignment process...")
 
     # Build mapping from role name to destination role ID.
     role_mapping = create_role_mapping(roles_mapping_file)
     
-    # Retrieve destination users and build an email-to-userID mapping.
-    dest_users_response = get_users_with_pagination(destination)
-    dest_users = dest_users_response.get("items", [])
-    email_to_userid = {
-        user.get('email').strip(): user.get('id')
-        for user in dest_users if user.get('email') and user.get('id')
-    }
-    print("Email to user ID mapping:", email_to_userid)
+    # Retrieve destination users and build an email-to-userID mapping (cached between runs).
+    email_to_userid = load_cached_email_mapping(destination)
+    from_cache = email_to_userid is not None
+    if from_cache:
+        logger.info("Using cached destination users from %s", users_cache_path(destination))
+    else:
+        email_to_userid = fetch_email_mapping(destination)
+    logger.info("Found %d destination users", len(email_to_userid))
     
-    # Group CSV rows by (email, tenantId) for efficient processing.
-    groups = defaultdict(list)
-    with open(source_file, mode='r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            email = row.get('email', '').strip()
-            tenant_id = row.get('tenantId', '').strip()
-            groups[(email, tenant_id)].append(row)
-    print("Grouped CSV rows by (email, tenantId):")
-    for key, rows in groups.items():
-        print(f"{key}: {len(rows)} rows")
+    # Resolve destination roles for the whole CSV at once, grouped by (email, tenantId).
+    # Sets drop repeated assignments of the same role; groups without mapped roles are kept.
+    df = pd.read_csv(source_file, dtype=str, keep_default_na=False,
+                     usecols=lambda column: column in ('email', 'tenantId', 'name'))
+    df = df.reindex(columns=['email', 'tenantId', 'name'], fill_value='')
+    df = df.apply(lambda column: column.str.strip())
+    # Use the role name from the source CSV.
+    df['dst_role'] = df['name'].map(role_mapping)
+    grouped = df.groupby(['email', 'tenantId'], sort=False)['dst_role'].agg(lambda roles: set(roles.dropna()))
+    groups = dict(zip(grouped.index, grouped))
+    logger.info("Grouped CSV rows into %d (email, tenantId) pairs", len(groups))
     
-    # Process each group: aggregate destination role IDs and post them.
-    for (email, tenant_id), rows in groups.items():
-        dest_user_id = email_to_userid.get(email)
-        if not dest_user_id:
-            print(f"Destination user not found for email: {email}")
-            continue
-        
-        role_ids = []
-        for row in rows:
-            # Use the role name from the source CSV.
-            role_name = row.get('name', '').strip()
-            dst_role = role_mapping.get(role_name)
-            print(f"Processing row for email '{email}': role name '{role_name}' maps to destination role '{dst_role}'")
-            if dst_role:
-                role_ids.append(dst_role)
+    # A cached mapping may predate recently migrated users; refetch once if any are missing
+    if from_cache and any(email not in email_to_userid for email, _ in groups):
+        logger.info("Cached destination users are missing some emails, refetching...")
+        email_to_userid = fetch_email_mapping(destination)
+    
+    # Process each group: post the aggregated destination role IDs.
+    base_headers = {
+        'Authorization': f"Bearer {destination.token}",
+        'Content-Type': 'application/json'
+    }
+    with ThreadPoolExecutor(max_workers=ROLE_ASSIGNMENT_WORKERS) as executor:
+        futures = []
+        for (email, tenant_id), role_ids in groups.items():
+            dest_user_id = email_to_userid.get(email)
+            if not dest_user_id:
+                logger.warning("Destination user not found for email: %s", email)
+                continue
+            
+            if role_ids:
+                logger.debug("Assigning roles %s to destination user %s for tenant '%s'", sorted(role_ids), dest_user_id, tenant_id)
+                futures.append(executor.submit(
+                    post_roles_to_user, destination, dest_user_id, tenant_id, list(role_ids), base_headers
+                ))
+            else:
+                logger.warning("No valid roles to assign for destination user %s (email: %s)", dest_user_id, email)
         
-        if role_ids:
-            print(f"Assigning roles {role_ids} to destination user {dest_user_id} for tenant '{tenant_id}'")
-            post_roles_to_user(destination, dest_user_id, tenant_id, role_ids)
-        else:
-            print(f"No valid roles to assign for destination user {dest_user_id} (email: {email})")
+        for future in as_completed(futures):
+            future.result()
 
-def post_roles_to_user(client, user_id, tenant_id, role_ids):
+def post_roles_to_user(client, user_id, tenant_id, role_ids, base_headers=None):
     url = f"{client.base_url}/identity/resources/users/v1/{user_id}/roles"
-    headers = {
-        'Authorization': f"Bearer {client.token}",
-        'Content-Type': 'application/json',
-        'frontegg-tenant-id': tenant_id
-    }
+    if base_headers is None:
+        base_headers = {
+            'Authorization': f"Bearer {client.token}",
+            'Content-Type': 'application/json'
+        }
+    headers = {**base_headers, 'frontegg-tenant-id': tenant_id}
     data = {"roleIds": role_ids}
-    print(f"Posting roles to user {user_id} in tenant '{tenant_id}': {role_ids}")
-    response = requests.post(url, headers=headers, json=data)
-    print(f"Post response status code: {response.status_code}")
+    logger = get_logger()
+    logger.debug("Posting roles to user %s in tenant '%s': %s", user_id, tenant_id, role_ids)
+    ROLE_ASSIGNMENT_LIMITER.acquire()
+    response = client.session.post(url, headers=headers, json=data)
+    logger.debug("Post response status code: %s", response.status_code)
     if response.status_code == 200:
-        print(f"Successfully assigned roles to user {user_id} in tenant {tenant_id}.")
+        logger.info("Successfully assigned roles to user %s in tenant %s.", user_id, tenant_id)
     else:
-        print(f"Failed to assign roles to user {user_id} in tenant {tenant_id}. Response: {response.text}")
+        logger.error("Failed to assign roles to user %s in tenant %s. Response: %s", user_id, tenant_id, response.text)
@@ -1,99 +1,115 @@
-import csv
-import requests
-import os
+import json
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from utility.frontegg_client import FronteggClient
-from dotenv import load_dotenv
+from utility.rate_limiter import TokenBucket
+from utility.settings import get_settings
 import logging
 
-# Load environment variables
-load_dotenv()
-
 # Update these to match your environment
 CSV_FILE_PATH = "account_data/user_tenants_with_roles.csv"
+CSV_COLUMNS = ["tenantId", "email", "id", "name"]
 API_URL = "https://api.us.frontegg.com/identity/resources/users/bulk/v1/invite"
 
+# Tenants invited concurrently, kept under the API's 30 requests per second
+INVITE_WORKERS = 16
+INVITE_LIMITER = TokenBucket(30)
+
 # Configure logging
 logging.basicConfig(filename='log.txt', level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-def main():
-    # Initialize Frontegg client to get the token
-    frontegg_client = FronteggClient(os.getenv("BASE_URL_2"), 
-                                     os.getenv("CLIENT_ID_2"), 
-                                     os.getenv("API_KEY_2"))
-    BEARER_TOKEN = frontegg_client.token
+def bulk_invite_users(source, destination, csv_path=CSV_FILE_PATH):
+    """
+    Invites users to their destination tenants in bulk, one request per tenant.
+    - source: client for the source account (available for future use)
+    - destination: client for the destination account (token and session are reused)
+    """
+    BEARER_TOKEN = destination.token
 
     logging.info("Starting bulk invite process")
 
-    # Dictionary to group data: { tenantId: { email: { "name": ..., "roleIds": set(...) } } }
-    grouped_data = {}
-
-    # Read the CSV file and process each row
+    # Read the CSV file; every column is kept as a string and missing values as ""
     try:
-        with open(CSV_FILE_PATH, mode="r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)  # Convert iterator to list to allow multiple passes
-            logging.info(f"Number of rows read from CSV: {len(rows)}")
+        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False,
+                         usecols=lambda column: column in CSV_COLUMNS)
+        logging.info(f"Number of rows read from CSV: {len(df)}")
     except Exception as e:
         logging.error(f"Error reading CSV file: {e}")
         return
+    df = df.reindex(columns=CSV_COLUMNS, fill_value="")
 
-    for row in rows:
-        tenant_id = row.get("tenantId")
-        email = row.get("email")
-        role_id = row.get("id")
-        name = row.get("name", "")
-
-        # Skip the row if required fields are missing
-        if not tenant_id or not email or not role_id:
-            logging.warning(f"Skipping row with missing required fields: {row}")
-            continue
-
-        if tenant_id not in grouped_data:
-            grouped_data[tenant_id] = {}
-        if email not in grouped_data[tenant_id]:
-            grouped_data[tenant_id][email] = {
-                "name": name,
-                "roleIds": set(),
-            }
-        grouped_data[tenant_id][email]["roleIds"].add(role_id)
-
-    logging.info(f"Grouped data: {grouped_data}")
-
-    # For each tenant, send a single POST request with all its users
-    for tenant_id, users_dict in grouped_data.items():
-        users_payload = []
-        for email, user_info in users_dict.items():
-            users_payload.append({
-                "email": email,
-                "name": user_info["name"],
-                "skipInviteEmail": True,  # Adjust based on your needs
-                "roleIds": list(user_info["roleIds"]),
-                "verified": True          # Adjust based on your needs
-            })
-
-        # Prepare headers with the bearer token and the tenant ID
-        headers = {
-            "Authorization": f"Bearer {BEARER_TOKEN}",
-            "Content-Type": "application/json",
-            "frontegg-tenant-id": tenant_id,
-        }
-
-        payload = {"users": users_payload}
-
-        logging.info(f"Inviting users for tenant {tenant_id}")
-        logging.info(f"Payload for tenant {tenant_id}: {payload}")
-
-        response = requests.post(API_URL, headers=headers, json=payload)
-        if response.status_code == 200:
-            logging.info(f"Successfully invited users for tenant {tenant_id}")
-        elif response.status_code == 202:
-            job_id = response.json().get("id", "unknown")
-            logging.info(f"202 successful bulk invite request! job ID {job_id}")
-        else:
-            logging.error(f"Error inviting users for tenant {tenant_id}: {response.status_code} - {response.text}")
+    # Skip rows with missing required fields
+    incomplete = (df[["tenantId", "email", "id"]] == "").any(axis=1)
+    if incomplete.any():
+        logging.warning("Skipping %d row(s) with missing required fields", int(incomplete.sum()))
+        logging.debug("Skipped rows: %s", df[incomplete].to_dict("records"))
+        df = df[~incomplete]
+
+    # Dictionary to group data: { tenantId: { email: { "name": ..., "roleIds": set(...) } } }
+    grouped = df.groupby(["tenantId", "email"], sort=False).agg(name=("name", "first"), roleIds=("id", set))
+    grouped_data = {}
+    for (tenant_id, email), name, role_ids in zip(grouped.index, grouped["name"], grouped["roleIds"]):
+        grouped_data.setdefault(tenant_id, {})[email] = {"name": name, "roleIds": role_ids}
+
+    logging.info("Grouped CSV rows into %d tenant(s)", len(grouped_data))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Grouped data: %s", grouped_data)
+
+    # For each tenant, send a single POST request with all its users (tenants run concurrently)
+    with ThreadPoolExecutor(max_workers=INVITE_WORKERS) as executor:
+        futures = [
+            executor.submit(invite_tenant, destination, BEARER_TOKEN, tenant_id, users_dict)
+            for tenant_id, users_dict in grouped_data.items()
+        ]
+        for future in as_completed(futures):
+            future.result()
 
     logging.info("Bulk invite process completed")
 
+def invite_tenant(destination, bearer_token, tenant_id, users_dict):
+    """Sends the bulk invite request for a single tenant."""
+    users_payload = []
+    for email, user_info in users_dict.items():
+        users_payload.append({
+            "email": email,
+            "name": user_info["name"],
+            "skipInviteEmail": True,  # Adjust based on your needs
+            "roleIds": list(user_info["roleIds"]),
+            "verified": True          # Adjust based on your needs
+        })
+
+    # Prepare headers with the bearer token and the tenant ID
+    headers = {
+        "Authorization": f"Bearer {bearer_token}",
+        "Content-Type": "application/json",
+        "frontegg-tenant-id": tenant_id,
+    }
+
+    payload = {"users": users_payload}
+
+    logging.info(f"Inviting users for tenant {tenant_id}")
+    logging.debug("Payload for tenant %s: %s", tenant_id, payload)
+
+    # Compact encoding: the payload can hold thousands of users per tenant
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    INVITE_LIMITER.acquire()
+    response = destination.session.post(API_URL, headers=headers, data=body)
+    if response.status_code == 200:
+        logging.info(f"Successfully invited users for tenant {tenant_id}")
+    elif response.status_code == 202:
+        job_id = response.json().get("id", "unknown")
+        logging.info(f"202 successful bulk invite request! job ID {job_id}")
+    else:
+        logging.error(f"Error inviting users for tenant {tenant_id}: {response.status_code} - {response.text}")
+
+def main():
+    # Standalone entry point: authenticate against the destination account only
+    settings = get_settings()
+    frontegg_client = FronteggClient(settings.BASE_URL_2,
+                                     settings.CLIENT_ID_2,
+                                     settings.API_KEY_2)
+    bulk_invite_users(None, frontegg_client)
+
 if __name__ == "__main__":
     main()
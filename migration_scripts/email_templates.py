@@ -1,15 +1,10 @@
-import requests
 import json
-from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
 import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Migration flags
-MIGRATE_EMAIL_TEMPLATES = os.getenv("MIGRATE_EMAIL_TEMPLATES", "False").lower() == "true"
-MIGRATE_EMAIL_SENDER = os.getenv("MIGRATE_EMAIL_SENDER", "False").lower() == "true"
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
+from utility.settings import get_settings
+from utility.utils import write_private_json
 
 # Email template types to migrate
 EMAIL_TEMPLATE_TYPES = [
@@ -32,6 +27,35 @@ EMAIL_TEMPLATE_TYPES = [
     "EmailVerification"
 ]
 
+# Fields to compare (excluding URLs that should be preserved in destination).
+# The large htmlTemplate body is compared last so cheap differences short-circuit first.
+TEMPLATE_COMPARE_FIELDS = (
+    'subject',
+    'fromName',
+    'active',
+    'senderEmail',
+    'htmlTemplate'
+)
+
+# Number of templates fetched (when the bulk endpoint is unavailable) or updated concurrently
+TEMPLATE_WORKERS = 8
+
+# Email provider configuration endpoints, and where the one each destination accepted is remembered
+PROVIDER_ENDPOINT_VERSIONS = ("v1", "v2")
+PROVIDER_ENDPOINT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "frontegg_migration", "email_provider_endpoints.json")
+
+# Destination URL fields kept as-is when a template is updated
+PRESERVED_URL_FIELDS = ("redirectURL", "successRedirectUrl", "redirectURLPattern", "successRedirectUrlPattern")
+
+@lru_cache(maxsize=4)
+def vendor_headers(token, vendor_id):
+    """Build the write headers once per token; callers must not mutate the result."""
+    return {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json',
+        'frontegg-vendor-id': vendor_id  # Add vendor ID header
+    }
+
 def get_email_templates(client):
     """Fetches all email templates from the account."""
     logger = get_logger()
@@ -41,67 +65,57 @@ def get_email_templates(client):
     headers = {'Authorization': f'Bearer {client.token}'}
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             all_templates = response.json()
             if isinstance(all_templates, list):
                 # Convert list to dict by template type
-                templates = {}
-                for template in all_templates:
-                    template_type = template.get("type")
-                    if template_type:
-                        templates[template_type] = template
-                        logger.debug(f"  ✓ Retrieved {template_type} template")
+                templates = {template["type"]: template for template in all_templates if template.get("type")}
+                logger.debug("  ✓ Retrieved templates: %s", ", ".join(templates))
                 return templates
     except Exception as e:
         logger.debug(f"  Bulk fetch failed, trying individual templates: {e}")
     
-    # Fall back to individual template fetching
-    templates = {}
-    for template_type in EMAIL_TEMPLATE_TYPES:
-        try:
-            response = requests.get(f"{url}/{template_type}", headers=headers)
-            if response.status_code == 200:
-                template_data = response.json()
-                templates[template_type] = template_data
-                logger.debug(f"  ✓ Retrieved {template_type} template")
-            elif response.status_code == 404:
-                logger.debug(f"  ⚠ Template {template_type} not found")
-            else:
-                logger.debug(f"  ✗ Failed to get {template_type}: {response.status_code}")
-        except Exception as e:
-            logger.debug(f"  ✗ Error getting {template_type}: {e}")
-    
-    return templates
+    # Fall back to fetching templates individually, in parallel
+    results = {}
+    with ThreadPoolExecutor(max_workers=TEMPLATE_WORKERS) as executor:
+        futures = {
+            executor.submit(get_email_template, client, url, headers, template_type): template_type
+            for template_type in EMAIL_TEMPLATE_TYPES
+        }
+        for future in as_completed(futures):
+            template_data = future.result()
+            if template_data is not None:
+                results[futures[future]] = template_data
+    
+    # Keep the EMAIL_TEMPLATE_TYPES order
+    return {template_type: results[template_type] for template_type in EMAIL_TEMPLATE_TYPES if template_type in results}
+
+def get_email_template(client, url, headers, template_type):
+    """Fetches a single email template, or None if it is missing or the request fails."""
+    logger = get_logger()
+    try:
+        response = client.session.get(f"{url}/{template_type}", headers=headers)
+        if response.status_code == 200:
+            logger.debug("  ✓ Retrieved %s template", template_type)
+            return response.json()
+        elif response.status_code == 404:
+            logger.debug(f"  ⚠ Template {template_type} not found")
+        else:
+            logger.debug(f"  ✗ Failed to get {template_type}: {response.status_code}")
+    except Exception as e:
+        logger.debug(f"  ✗ Error getting {template_type}: {e}")
+    return None
 
 def compare_templates(source_template, dest_template):
     """Compares two templates to check if they need updating."""
-    # Fields to compare (excluding URLs that should be preserved in destination)
-    fields_to_compare = [
-        'htmlTemplate',
-        'subject',
-        'fromName',
-        'active',
-        'senderEmail'
-    ]
-    
-    for field in fields_to_compare:
-        source_val = source_template.get(field)
-        dest_val = dest_template.get(field)
-        if source_val != dest_val:
-            return True
-    
-    return False
+    return any(source_template.get(field) != dest_template.get(field) for field in TEMPLATE_COMPARE_FIELDS)
 
 def update_email_template(client, template_type, template_data, dest_urls):
     """Updates an email template in the destination account."""
     logger = get_logger()
     url = f"{client.base_url}/identity/resources/mail/v1/configs/templates"
-    headers = {
-        'Authorization': f'Bearer {client.token}',
-        'Content-Type': 'application/json',
-        'frontegg-vendor-id': client.client_id  # Add vendor ID header
-    }
+    headers = vendor_headers(client.token, client.client_id)
     
     # Prepare the update payload
     # We preserve destination URLs but update the content
@@ -116,17 +130,10 @@ def update_email_template(client, template_type, template_data, dest_urls):
     
     # Preserve destination URLs
     if dest_urls:
-        if "redirectURL" in dest_urls:
-            update_data["redirectURL"] = dest_urls["redirectURL"]
-        if "successRedirectUrl" in dest_urls:
-            update_data["successRedirectUrl"] = dest_urls["successRedirectUrl"]
-        if "redirectURLPattern" in dest_urls:
-            update_data["redirectURLPattern"] = dest_urls["redirectURLPattern"]
-        if "successRedirectUrlPattern" in dest_urls:
-            update_data["successRedirectUrlPattern"] = dest_urls["successRedirectUrlPattern"]
+        update_data.update((key, dest_urls[key]) for key in PRESERVED_URL_FIELDS if key in dest_urls)
     
     try:
-        response = requests.post(url, headers=headers, json=update_data)
+        response = client.session.post(url, headers=headers, json=update_data)
         if response.status_code in [200, 201]:
             return True
         else:
@@ -140,18 +147,18 @@ def migrate_email_templates(source_client, destination_client):
     """Migrates email templates from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_EMAIL_TEMPLATES:
+    if not get_settings().MIGRATE_EMAIL_TEMPLATES:
         log_warning("Email templates migration is disabled (MIGRATE_EMAIL_TEMPLATES=False)")
         return
     
     log_subsection("Migrating Email Templates")
     
-    # Get templates from both accounts
-    logger.info("📧 Fetching email templates from source account...")
-    source_templates = get_email_templates(source_client)
-    
-    logger.info("📧 Fetching email templates from destination account...")
-    dest_templates = get_email_templates(destination_client)
+    # Get templates from both accounts in parallel
+    logger.info("📧 Fetching email templates from source and destination accounts...")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        source_future = executor.submit(get_email_templates, source_client)
+        dest_future = executor.submit(get_email_templates, destination_client)
+        source_templates, dest_templates = source_future.result(), dest_future.result()
     
     if not source_templates:
         log_warning("No email templates found in source account")
@@ -182,24 +189,26 @@ def migrate_email_templates(source_client, destination_client):
         success_count = 0
         
         logger.start_progress(len(templates_to_update), "Migrating templates")
-        for template_type in templates_to_update:
-            logger.update_progress(description=f"Updating {template_type}")
-            source_template = source_templates[template_type]
-            dest_template = dest_templates.get(template_type, {})
+        with ThreadPoolExecutor(max_workers=TEMPLATE_WORKERS) as executor:
+            futures = {}
+            for template_type in templates_to_update:
+                source_template = source_templates[template_type]
+                dest_template = dest_templates.get(template_type, {})
+                
+                # Preserve destination URLs
+                dest_urls = {key: dest_template.get(key) for key in PRESERVED_URL_FIELDS}
+                future = executor.submit(update_email_template, destination_client, template_type, source_template, dest_urls)
+                futures[future] = template_type
             
-            # Preserve destination URLs
-            dest_urls = {
-                "redirectURL": dest_template.get("redirectURL"),
-                "successRedirectUrl": dest_template.get("successRedirectUrl"),
-                "redirectURLPattern": dest_template.get("redirectURLPattern"),
-                "successRedirectUrlPattern": dest_template.get("successRedirectUrlPattern")
-            }
-            
-            if update_email_template(destination_client, template_type, source_template, dest_urls):
-                success_count += 1
-                logger.debug(f"  ✓ Updated {template_type}")
-            else:
-                logger.debug(f"  ✗ Failed to update {template_type}")
+            # Progress is only touched from this thread
+            for future in as_completed(futures):
+                template_type = futures[future]
+                logger.update_progress(description=f"Updated {template_type}")
+                if future.result():
+                    success_count += 1
+                    logger.debug(f"  ✓ Updated {template_type}")
+                else:
+                    logger.debug(f"  ✗ Failed to update {template_type}")
         
         logger.stop_progress()
         log_success(f"✓ Successfully migrated {success_count}/{len(templates_to_update)} email templates")
@@ -213,7 +222,7 @@ def get_email_provider(client):
     headers = {'Authorization': f'Bearer {client.token}'}
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             data = response.json()
             if data and isinstance(data, dict):
@@ -224,11 +233,32 @@ def get_email_provider(client):
         logger.debug(f"  ✗ Error getting email provider: {e}")
         return None
 
+def provider_endpoint_key(client):
+    """Entries are kept per account; base_url alone is the shared regional API host."""
+    return f"{client.base_url}|{client.client_id}"
+
+def load_provider_endpoint_versions():
+    """Returns the remembered email provider endpoint version per destination account."""
+    try:
+        with open(PROVIDER_ENDPOINT_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_provider_endpoint_version(client, version):
+    """Remembers which email provider endpoint version the destination accepted."""
+    versions = load_provider_endpoint_versions()
+    versions[provider_endpoint_key(client)] = version
+    try:
+        write_private_json(PROVIDER_ENDPOINT_CACHE_PATH, versions)
+    except OSError as e:
+        get_logger().debug(f"  Could not save email provider endpoint version: {e}")
+
 def migrate_email_provider(source_client, destination_client):
     """Migrates email provider configuration from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_EMAIL_SENDER:
+    if not get_settings().MIGRATE_EMAIL_SENDER:
         log_warning("Email sender migration is disabled (MIGRATE_EMAIL_SENDER=False)")
         return
     
@@ -261,13 +291,10 @@ def migrate_email_provider(source_client, destination_client):
     # Configure provider in destination
     logger.info(f"🔄 Configuring {provider_type} provider in destination account...")
     
-    # Try v1 endpoint first (which worked in the past)
-    url = f"{destination_client.base_url}/identity/resources/mail/v1/configurations"
-    headers = {
-        'Authorization': f'Bearer {destination_client.token}',
-        'Content-Type': 'application/json',
-        'frontegg-vendor-id': destination_client.client_id  # Add vendor ID header
-    }
+    # Try the version that last worked for this destination first (v1 by default), then the other
+    headers = vendor_headers(destination_client.token, destination_client.client_id)
+    preferred = load_provider_endpoint_versions().get(provider_endpoint_key(destination_client), "v1")
+    versions = [preferred] + [version for version in PROVIDER_ENDPOINT_VERSIONS if version != preferred]
     
     data = {
         "provider": provider_type,
@@ -275,18 +302,17 @@ def migrate_email_provider(source_client, destination_client):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        for version in versions:
+            url = f"{destination_client.base_url}/identity/resources/mail/{version}/configurations"
+            response = destination_client.session.post(url, headers=headers, json=data)
+            if response.status_code not in (403, 404):
+                break
+            logger.debug(f"  {version} endpoint failed with {response.status_code}, trying the next version...")
+        
         if response.status_code in [200, 201]:
             log_success(f"✓ Successfully configured {provider_type} email provider")
-        elif response.status_code == 403 or response.status_code == 404:
-            # Try v2 endpoint as fallback
-            logger.debug(f"  v1 endpoint failed with {response.status_code}, trying v2...")
-            url = f"{destination_client.base_url}/identity/resources/mail/v2/configurations"
-            response = requests.post(url, headers=headers, json=data)
-            if response.status_code in [200, 201]:
-                log_success(f"✓ Successfully configured {provider_type} email provider")
-            else:
-                log_error(f"✗ Failed to configure email provider: {response.status_code} - {response.text}")
+            if version != preferred:
+                save_provider_endpoint_version(destination_client, version)
         else:
             log_error(f"✗ Failed to configure email provider: {response.status_code} - {response.text}")
     except Exception as e:
@@ -296,12 +322,13 @@ def migrate_email_configuration(source_client, destination_client):
     """Main function to migrate email templates and provider."""
     logger = get_logger()
     logger.section("Email Configuration Migration")
+    settings = get_settings()
     
-    if MIGRATE_EMAIL_TEMPLATES:
+    if settings.MIGRATE_EMAIL_TEMPLATES:
         migrate_email_templates(source_client, destination_client)
     
-    if MIGRATE_EMAIL_SENDER:
+    if settings.MIGRATE_EMAIL_SENDER:
         migrate_email_provider(source_client, destination_client)
     
-    if not MIGRATE_EMAIL_TEMPLATES and not MIGRATE_EMAIL_SENDER:
+    if not settings.MIGRATE_EMAIL_TEMPLATES and not settings.MIGRATE_EMAIL_SENDER:
         log_warning("Both email templates and sender migration are disabled")
\ No newline at end of file
@@ -1,79 +1,117 @@
 import csv
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from utility.utils import log
+from migration_scripts.assign_roles_to_users import OFFSET_PATTERN
 
-# Function to read groups from CSV and create them in the destination account
-def fetch_users_from_destination(client, tenant_id):
-    """Fetch users from the destination account for a given tenant."""
-    url = f"{client.base_url}/identity/resources/users/v3?_limit=200"
-    headers = {
-        'Authorization': f'Bearer {client.token}',
+USERS_PAGE_SIZE = 200
+# Number of groups (and tenant user lists) processed concurrently
+GROUP_WORKERS = 8
+
+@lru_cache(maxsize=1024)
+def tenant_headers(token, tenant_id):
+    """Build the request headers once per token and tenant; callers must not mutate the result."""
+    return {
+        'Authorization': f'Bearer {token}',
         'Content-Type': 'application/json',
         'frontegg-tenant-id': tenant_id
     }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    users = response.json().get('items', [])
-    return {user['email']: user['id'] for user in users}
+
+# Function to read groups from CSV and create them in the destination account
+def iter_users_from_destination(client, tenant_id):
+    """Yield every user of a tenant in the destination account, one page at a time."""
+    url = f"{client.base_url}/identity/resources/users/v3"
+    headers = tenant_headers(client.token, tenant_id)
+    params = {'_limit': USERS_PAGE_SIZE}
+    while True:
+        response = client.session.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        page = response.json()
+        users = page.get('items', [])
+        yield from users
+        # Follow the API's next link (its _offset is a page index, not an item count);
+        # a short page is the last one, even if the API still returns a next link
+        next_page = page.get('_links', {}).get('next', '')
+        offset_match = OFFSET_PATTERN.search(next_page) if next_page else None
+        if len(users) < USERS_PAGE_SIZE or not offset_match:
+            return
+        params = {'_limit': USERS_PAGE_SIZE, '_offset': offset_match.group(1)}
+
+def fetch_users_from_destination(client, tenant_id):
+    """Fetch users from the destination account for a given tenant."""
+    return {user['email']: user['id'] for user in iter_users_from_destination(client, tenant_id)}
 
 def migrate_groups(frontegg_client_1, frontegg_client_2):
     # Read the CSV file
+    groups = []
     with open('account_data/groups.csv', newline='') as csvfile:
-        group_reader = csv.DictReader(csvfile)
+        group_reader = csv.reader(csvfile)
+        # Resolve the column positions once from the header
+        header = next(group_reader, [])
+        tenant_col, name_col, description_col, emails_col = (
+            header.index(column) for column in ('tenantId', 'name', 'description', 'userEmails')
+        )
         for row in group_reader:
-            tenant_id = row['tenantId']
-            name = row['name']
-            description = row['description']
+            user_emails = [email.strip() for email in row[emails_col].split(',')] if row[emails_col] else []
+            groups.append((row[tenant_col], row[name_col], row[description_col], user_emails))
 
             # Skip groups where both userIds and userEmails are null
             # if not row['userIds'] and not row['userEmails']:
             #     log(f"Skipping group '{name}' as both userIds and userEmails are null.")
             #     continue
 
-            # Prepare the API request to create the group
-            url = f"{frontegg_client_2.base_url}/identity/resources/groups/v1"
-            headers = {
-                'Authorization': f'Bearer {frontegg_client_2.token}',
-                'Content-Type': 'application/json',
-                'frontegg-tenant-id': tenant_id
-            }
-            data = {
-                'name': name,
-                'description': description
-            }
+    with ThreadPoolExecutor(max_workers=GROUP_WORKERS) as executor:
+        # Fetch users from the destination account once per tenant that has users to assign
+        tenant_ids = {tenant_id for tenant_id, _, _, user_emails in groups if user_emails}
+        user_futures = {
+            tenant_id: executor.submit(fetch_users_from_destination, frontegg_client_2, tenant_id)
+            for tenant_id in tenant_ids
+        }
+        tenant_users = {tenant_id: future.result() for tenant_id, future in user_futures.items()}
+
+        # Create the groups and assign their users, one task per group
+        futures = [
+            executor.submit(migrate_group, frontegg_client_2, tenant_id, name, description, user_emails,
+                            tenant_users.get(tenant_id, {}))
+            for tenant_id, name, description, user_emails in groups
+        ]
+        for future in as_completed(futures):
+            future.result()
 
-            # Make the API request to create the group
-            response = requests.post(url, headers=headers, json=data)
+def migrate_group(client, tenant_id, name, description, user_emails, email_to_user_id):
+    """Create a single group in the destination account and assign its users."""
+    # Prepare the API request to create the group
+    url = f"{client.base_url}/identity/resources/groups/v1"
+    headers = tenant_headers(client.token, tenant_id)
+    data = {
+        'name': name,
+        'description': description
+    }
 
-            if response.status_code == 201:
-                group_id = response.json().get('id')
-                log(f"Successfully created group '{name}' with ID: {group_id}")
+    # Make the API request to create the group
+    response = client.session.post(url, headers=headers, json=data)
 
-                # Fetch users from the destination account
-                email_to_user_id = fetch_users_from_destination(frontegg_client_2, tenant_id)
+    if response.status_code == 201:
+        group_id = response.json().get('id')
+        log(f"Successfully created group '{name}' with ID: {group_id}")
 
-                # Map emails to user IDs
-                user_emails = row['userEmails'].split(',') if row['userEmails'] else []
-                user_ids = [email_to_user_id[email] for email in user_emails if email in email_to_user_id]
+        # Map emails to user IDs
+        user_ids = [email_to_user_id[email] for email in user_emails if email in email_to_user_id]
 
-                # Assign users to the group
-                if user_ids:
-                    assign_users_to_group(frontegg_client_2, tenant_id, group_id, user_ids)
-                else:
-                    log(f"No valid user IDs found for group '{name}'.")
-            else:
-                log(f"Failed to create group '{name}'. Status Code: {response.status_code}, Response: {response.text}")
+        # Assign users to the group
+        if user_ids:
+            assign_users_to_group(client, tenant_id, group_id, user_ids)
+        else:
+            log(f"No valid user IDs found for group '{name}'.")
+    else:
+        log(f"Failed to create group '{name}'. Status Code: {response.status_code}, Response: {response.text}")
 
 def assign_users_to_group(client, tenant_id, group_id, user_ids):
     """Assign users to a group in the destination account."""
     url = f"{client.base_url}/identity/resources/groups/v1/{group_id}/users"
-    headers = {
-        'Authorization': f'Bearer {client.token}',
-        'Content-Type': 'application/json',
-        'frontegg-tenant-id': tenant_id
-    }
+    headers = tenant_headers(client.token, tenant_id)
     data = {'userIds': user_ids}
-    response = requests.post(url, headers=headers, json=data)
+    response = client.session.post(url, headers=headers, json=data)
     if response.status_code == 201:
         log(f"Successfully assigned users to group ID: {group_id}")
     else:
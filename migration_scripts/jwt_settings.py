@@ -1,14 +1,7 @@
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Migration flag
-MIGRATE_JWT_SETTINGS = os.getenv("MIGRATE_JWT_SETTINTS", "False").lower() == "true"
+from utility.settings import get_settings
 
 def get_jwt_settings(client):
     """Fetches JWT settings from the account."""
@@ -17,7 +10,7 @@ def get_jwt_settings(client):
     headers = {'Authorization': f'Bearer {client.token}'}
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             data = response.json()
             # Extract relevant JWT settings
@@ -47,7 +40,7 @@ def update_jwt_settings(client, settings):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=settings)
+        response = client.session.post(url, headers=headers, json=settings)
         if response.status_code in [200, 201]:
             return True
         else:
@@ -72,16 +65,19 @@ def migrate_jwt_settings(source_client, destination_client):
     """Migrates JWT settings from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_JWT_SETTINGS:
-        log_warning("JWT settings migration is disabled (MIGRATE_JWT_SETTINTS=False)")
+    if not get_settings().MIGRATE_JWT_SETTINGS:
+        log_warning("JWT settings migration is disabled (MIGRATE_JWT_SETTINGS=False)")
         return
     
     logger.section("JWT Settings Migration")
     log_subsection("Migrating JWT Settings")
     
-    # Get JWT settings from source
-    logger.info("🔐 Fetching JWT settings from source account...")
-    source_settings = get_jwt_settings(source_client)
+    # Get JWT settings from both accounts in parallel
+    logger.info("🔐 Fetching JWT settings from source and destination accounts...")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        source_future = executor.submit(get_jwt_settings, source_client)
+        dest_future = executor.submit(get_jwt_settings, destination_client)
+        source_settings, dest_settings = source_future.result(), dest_future.result()
     
     if not source_settings:
         log_error("✗ Failed to fetch JWT settings from source account")
@@ -89,10 +85,6 @@ def migrate_jwt_settings(source_client, destination_client):
     
     logger.info(f"  Found settings: {json.dumps(source_settings, indent=2)}")
     
-    # Get JWT settings from destination
-    logger.info("🔐 Fetching JWT settings from destination account...")
-    dest_settings = get_jwt_settings(destination_client)
-    
     # Compare settings
     if not compare_jwt_settings(source_settings, dest_settings):
         log_success("✓ JWT settings are already up to date in destination")
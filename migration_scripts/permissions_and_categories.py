@@ -1,15 +1,19 @@
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 from utility.utils import log
+from utility.logger import log_detailed_api_call
 from migration_scripts.tenants import make_request_with_rate_limiting, get_headers
 
-def log_detailed_api_call(method, url, headers=None, data=None):
-    """Log all details of the API call."""
-    log(f"API CALL: {method} {url}")
-    if headers:
-        log(f"Headers: {json.dumps(headers, indent=2)}")
-    if data:
-        log(f"Data Payload: {json.dumps(data, indent=2)}")
+# Number of permission batches posted concurrently
+PERMISSION_BATCH_WORKERS = 4
+
+ALREADY_EXISTS_PATTERN = re.compile(r'already exist', re.IGNORECASE)
+
+def reports_already_exists(error_content):
+    """Whether an API error body says the resource already exists."""
+    return bool(ALREADY_EXISTS_PATTERN.search('\n'.join(error_content.get('errors', []))))
 
 def get_categories(client):
     log("Getting categories from account.")
@@ -38,6 +42,7 @@ def get_categories(client):
         return []
 
 def create_categories(client, categories):
+    """Create categories missing from the destination; callers pass only unmatched categories."""
     log("Creating categories in destination account.")
     endpoint = client.base_url + '/identity/resources/permissions/v1/categories'
     headers = get_headers(client)
@@ -57,7 +62,7 @@ def create_categories(client, categories):
         except requests.exceptions.HTTPError as e:
             if e.response is not None:
                 error_content = e.response.json()
-                if any("already exist" in error.lower() for error in error_content.get('errors', [])):
+                if reports_already_exists(error_content):
                     log(f"Category '{category['name']}' already exists. Skipping.")
                 else:
                     raise
@@ -79,66 +84,83 @@ def get_permissions(client):
         log(f"Error fetching permissions: {e}")
         return []
 
-def create_permissions(client, permissions, batch_size=100):
+def iter_permission_batches(permissions, category_mapping, batch_size=100):
+    """Yield create payloads in batches, remapping each permission to its destination category.
+
+    Permissions without a key or without a mapped category are left out.
+    """
+    batch = []
+    for permission in permissions:
+        category_id = category_mapping.get(permission.get('categoryId'))
+        if not category_id or not permission.get('key'):
+            continue
+        batch.append({
+            'key': permission['key'],
+            'name': permission['name'],
+            'description': permission.get('description', ''),
+            'categoryId': category_id,
+        })
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def create_permissions(client, permission_batches):
+    """Create the given permission batches; returns the number of permissions submitted."""
     log("Creating permissions in destination account.")
     endpoint = client.base_url + '/identity/resources/permissions/v1'
     headers = get_headers(client)
-    
-    # Prepare permissions data in batches
-    for i in range(0, len(permissions), batch_size):
-        permissions_batch = permissions[i:i + batch_size]
-        permissions_data = [
-            {
-                'key': permission['key'],
-                'name': permission['name'],
-                'description': permission.get('description', ''),
-                'categoryId': permission['categoryId'],
-            }
-            for permission in permissions_batch if permission.get('key') and permission.get('categoryId')
-        ]
+    submitted = 0
 
-        if not permissions_data:
-            log("No valid permissions to create in this batch. Skipping.")
-            continue
-
-        log(f"Creating batch of {len(permissions_data)} permissions.")
-        
-        # Log the API call details for each batch
-        log_detailed_api_call("POST", endpoint, headers=headers, data=permissions_data)
-        
-        try:
-            response = make_request_with_rate_limiting('POST', endpoint, client, headers=headers, json_data=permissions_data)
-            log(f"Batch creation of permissions completed with status code: {response.status_code}")
-        except requests.exceptions.HTTPError as e:
-            if e.response is not None:
-                error_content = e.response.json()
-                log(f"Error creating permissions batch. Response content:\n{json.dumps(error_content, indent=2)}")
-            else:
-                raise
+    # Keep several batches in flight; the rate limiter spaces out the requests
+    with ThreadPoolExecutor(max_workers=PERMISSION_BATCH_WORKERS) as executor:
+        futures = []
+        for batch in permission_batches:
+            submitted += len(batch)
+            futures.append(executor.submit(create_permissions_batch, client, endpoint, headers, batch))
+        for future in as_completed(futures):
+            future.result()
 
     log("Permissions creation completed.")
+    return submitted
+    
+def create_permissions_batch(client, endpoint, headers, permissions_data):
+    log(f"Creating batch of {len(permissions_data)} permissions.")
     
+    try:
+        response = make_request_with_rate_limiting('POST', endpoint, client, headers=headers, json_data=permissions_data)
+        log(f"Batch creation of permissions completed with status code: {response.status_code}")
+    except requests.exceptions.HTTPError as e:
+        # Only dump the request details for batches that failed
+        log_detailed_api_call("POST", endpoint, headers=headers, data=permissions_data)
+        if e.response is not None:
+            error_content = e.response.json()
+            log(f"Error creating permissions batch. Response content:\n{json.dumps(error_content, indent=2)}")
+        else:
+            raise
+
 def migrate_settings(source_client, destination_client, migrate_categories, migrate_permissions):
     """Orchestrate the migration of categories and permissions."""
     log("Starting settings migration.")
     
-    # Step 1: Fetch categories from source and destination
-    source_categories = get_categories(source_client)
+    # Step 1: Fetch categories from source and destination (and source permissions) in parallel
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        source_categories_future = executor.submit(get_categories, source_client)
+        destination_categories_future = executor.submit(get_categories, destination_client)
+        source_permissions_future = executor.submit(get_permissions, source_client) if migrate_permissions else None
+        source_categories = source_categories_future.result()
+        destination_categories = destination_categories_future.result()
     log(f"Retrieved {len(source_categories)} categories from source.")
-    
-    destination_categories = get_categories(destination_client)
     log(f"Retrieved {len(destination_categories)} categories from destination.")
     
     # Step 2: Map source categories to destination categories based on name and description
+    dest_index = {(dest_cat['name'], dest_cat.get('description', '')): dest_cat['id'] for dest_cat in destination_categories}
     category_mapping = {}
     for src_cat in source_categories:
-        matching_dest_cat = next(
-            (dest_cat for dest_cat in destination_categories
-             if dest_cat['name'] == src_cat['name'] and dest_cat.get('description', '') == src_cat.get('description', '')),
-            None
-        )
-        if matching_dest_cat:
-            category_mapping[src_cat['id']] = matching_dest_cat['id']
+        dest_id = dest_index.get((src_cat['name'], src_cat.get('description', '')))
+        if dest_id:
+            category_mapping[src_cat['id']] = dest_id
 
     log(f"Category mapping completed with {len(category_mapping)} mapped categories.")
 
@@ -152,23 +174,18 @@ def migrate_settings(source_client, destination_client, migrate_categories, migr
 
     # Step 4: Migrate Permissions if enabled
     if migrate_permissions:
-        source_permissions = get_permissions(source_client)
+        source_permissions = source_permissions_future.result()
         log(f"Source permissions retrieved for migration: {len(source_permissions)} permissions.")
         
-        # Step 5: Assign the correct categoryId from destination to each permission
-        permissions_to_migrate = []
-        for permission in source_permissions:
-            dest_category_id = category_mapping.get(permission['categoryId'])
-            if dest_category_id:
-                permission['categoryId'] = dest_category_id
-                permissions_to_migrate.append(permission)
-            else:
-                log(f"Destination category mapping for permission '{permission['name']}' with source category ID '{permission['categoryId']}' not found. Skipping.")
+        # Step 5 & 6: Remap each permission to its destination categoryId and create them batch by batch
+        permission_batches = iter_permission_batches(source_permissions, category_mapping)
+        migrated_count = create_permissions(destination_client, permission_batches)
+        skipped_count = len(source_permissions) - migrated_count
+        if skipped_count:
+            log(f"Skipped {skipped_count} permissions without a key or a destination category mapping.")
 
-        # Step 6: Create permissions with mapped category IDs
-        if permissions_to_migrate:
-            log(f"{len(permissions_to_migrate)} permissions matched with categories for migration.")
-            create_permissions(destination_client, permissions_to_migrate)
+        if migrated_count:
+            log(f"{migrated_count} permissions matched with categories for migration.")
         else:
             log("No permissions with valid categories to migrate from the source.")
     else:
@@ -1,17 +1,24 @@
 import json
 import requests
 from utility.utils import log
+from utility.logger import get_logger, log_detailed_api_call
 from migration_scripts.tenants import make_request_with_rate_limiting
-from migration_scripts.permissions_and_categories import get_permissions
+from migration_scripts.permissions_and_categories import get_permissions, reports_already_exists
 import time
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain
 
-def log_detailed_api_call(method, url, headers=None, data=None):
-    """Log all details of the API call."""
-    log(f"API CALL: {method} {url}")
-    if headers:
-        log(f"Headers: {json.dumps(headers, indent=2)}")
-    if data:
-        log(f"Data Payload: {json.dumps(data, indent=2)}")
+@lru_cache(maxsize=1024)
+def role_headers(token, tenant_id=None):
+    """Build the request headers once per token and tenant; callers must not mutate the result."""
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+    if tenant_id:
+        headers['frontegg-tenant-id'] = tenant_id
+    return headers
 
 def get_roles(client, split=True):
     """
@@ -23,12 +30,8 @@ def get_roles(client, split=True):
     """
     log("Fetching roles from account (using v2 endpoint).")
     endpoint = client.base_url + '/identity/resources/roles/v2?_limit=2000'
-    headers = {
-        'Authorization': f'Bearer {client.token}',
-        'Content-Type': 'application/json'
-    }
+    headers = role_headers(client.token)
     try:
-        log_detailed_api_call("GET", endpoint, headers=headers)
         response = make_request_with_rate_limiting('GET', endpoint, client, headers=headers)
         data = response.json()
         
@@ -36,9 +39,10 @@ def get_roles(client, split=True):
         roles = data.get("items", [])
         log(f"Retrieved {len(roles)} roles from the v2 endpoint.")
         
-        # Log each retrieved role for detailed inspection
+        # Log each retrieved role for detailed inspection (formatted by the logger, debug level only)
+        logger = get_logger()
         for role in roles:
-            log(f"Role: {json.dumps(role, indent=2)}")
+            logger.debug("Role: %s", role)
             
         if not split:
             return roles
@@ -58,15 +62,8 @@ def get_roles(client, split=True):
 def create_roles(client, roles_with_tenant, roles_without_tenant):
     log("Creating roles")
     endpoint = client.base_url + '/identity/resources/roles/v1'
-    
-    headers = {
-        'Authorization': f'Bearer {client.token}',
-        'Content-Type': 'application/json'
-    }
+    headers = role_headers(client.token)
 
-    dest_permissions = get_permissions(client)
-    dest_permissions_by_key = {p['key']: p['id'] for p in dest_permissions}
-    
     role_id_mapping = {}  # Mapping from source role ID to destination role ID
 
     # Prepare list of role data for roles without tenantId (batch creation)
@@ -86,8 +83,6 @@ def create_roles(client, roles_with_tenant, roles_without_tenant):
     if len(roles_data_without_tenant) == 0:
         log("No new roles to create without tenantId. Skipping API call.")
     else:
-        log_detailed_api_call("POST", endpoint, headers=headers, data=roles_data_without_tenant)
-
         try:
             response = make_request_with_rate_limiting('POST', endpoint, client, headers=headers, json_data=roles_data_without_tenant)
             response_data = response.json()
@@ -98,63 +93,78 @@ def create_roles(client, roles_with_tenant, roles_without_tenant):
 
         except requests.exceptions.HTTPError as e:
             log(f"Error creating roles without tenantId: {e}")
-            if e.response:
+            log_detailed_api_call("POST", endpoint, headers=headers, data=roles_data_without_tenant)
+            if e.response is not None:
                 error_content = e.response.json()
                 log(f"Error response content:\n{json.dumps(error_content, indent=2)}")
-                if any("already exist" in error.lower() for error in error_content.get('errors', [])):
+                if reports_already_exists(error_content):
                     log("Some roles already exist. Skipping those.")
                 else:
                     raise
             else:
                 raise
 
-    # Handle roles with tenantId individually
+    # Handle roles with tenantId with one batch per tenant
+    roles_by_tenant = defaultdict(list)
     for role in roles_with_tenant:
-        role_data = {
+        roles_by_tenant[role['tenantId']].append(role)
+
+    for tenant_id, tenant_roles in roles_by_tenant.items():
+        create_tenant_roles(client, endpoint, tenant_id, tenant_roles, role_id_mapping)
+
+    log("Roles creation completed.")
+    return role_id_mapping
+
+def create_tenant_roles(client, endpoint, tenant_id, roles, role_id_mapping):
+    """Create a tenant's roles in one request, recording their destination IDs in role_id_mapping.
+
+    If the batch is rejected because a role already exists, the roles are retried one by one
+    so the others are still created.
+    """
+    roles_data = [
+        {
             'name': role['name'],
             'key': role['key'],
             'description': role.get('description', ''),
             'isDefault': role.get('isDefault', False),
-            'tenantId': role['tenantId'],
+            'tenantId': tenant_id,
             'level': role['level'],
         }
-        headers_with_tenant = headers.copy()
-        headers_with_tenant['frontegg-tenant-id'] = role['tenantId']
-
-        log(f"Creating role '{role['name']}' with tenantId '{role['tenantId']}'.")
-        log_detailed_api_call("POST", endpoint, headers=headers_with_tenant, data=[role_data])
+        for role in roles
+    ]
+    headers_with_tenant = role_headers(client.token, tenant_id)
 
-        try:
-            response = make_request_with_rate_limiting('POST', endpoint, client, headers=headers_with_tenant, json_data=[role_data])
-            created_roles = response.json()
-            for created_role in created_roles:
-                role_id_mapping[role["id"]] = created_role["id"]
-                log(f"Role '{role['name']}' created with ID: {created_role['id']}")
+    log(f"Creating {len(roles)} role(s) with tenantId '{tenant_id}'.")
+    try:
+        response = make_request_with_rate_limiting('POST', endpoint, client, headers=headers_with_tenant, json_data=roles_data)
+        created_roles = response.json()
+        for role, created_role in zip(roles, created_roles):
+            role_id_mapping[role["id"]] = created_role["id"]
+            log(f"Role '{role['name']}' created with ID: {created_role['id']}")
 
-        except requests.exceptions.HTTPError as e:
-            log(f"Error creating role '{role['name']}' with tenantId: {e}")
-            if e.response:
-                error_content = e.response.json()
-                log(f"Error response content for role '{role['name']}' with tenantId '{role['tenantId']}':\n{json.dumps(error_content, indent=2)}")
-                if any("already exist" in error.lower() for error in error_content.get('errors', [])):
-                    log("Role already exists. Skipping.")
+    except requests.exceptions.HTTPError as e:
+        log(f"Error creating roles with tenantId '{tenant_id}': {e}")
+        log_detailed_api_call("POST", endpoint, headers=headers_with_tenant, data=roles_data)
+        if e.response is not None:
+            error_content = e.response.json()
+            log(f"Error response content for roles with tenantId '{tenant_id}':\n{json.dumps(error_content, indent=2)}")
+            if reports_already_exists(error_content):
+                if len(roles) > 1:
+                    log("Some roles already exist. Creating the roles one by one.")
+                    for role in roles:
+                        create_tenant_roles(client, endpoint, tenant_id, [role], role_id_mapping)
                 else:
-                    raise
+                    log("Role already exists. Skipping.")
             else:
                 raise
-        except Exception as e:
-            log(f"Error creating role '{role['name']}' with tenantId: {e}")
+        else:
             raise
-
-    log("Roles creation completed.")
-    return role_id_mapping
+    except Exception as e:
+        log(f"Error creating roles with tenantId '{tenant_id}': {e}")
+        raise
 
 def assign_permissions_to_roles(client, roles, role_id_mapping, dest_permissions_by_key):
     log("Assigning permissions to roles")
-    headers = {
-        'Authorization': f'Bearer {client.token}',
-        'Content-Type': 'application/json'
-    }
 
     for role in roles:
         dest_role_id = role_id_mapping.get(role['id'])
@@ -163,9 +173,10 @@ def assign_permissions_to_roles(client, roles, role_id_mapping, dest_permissions
             continue
 
         # Map source permission IDs to destination permission IDs
+        permissions_by_id = {p['id']: p for p in role.get('permissionsData', [])}
         permission_ids = []
         for perm_id in role.get('permissions', []):
-            source_permission = next((p for p in role.get('permissionsData', []) if p['id'] == perm_id), None)
+            source_permission = permissions_by_id.get(perm_id)
             if source_permission:
                 perm_key = source_permission['key']
                 dest_perm_id = dest_permissions_by_key.get(perm_key)
@@ -179,16 +190,14 @@ def assign_permissions_to_roles(client, roles, role_id_mapping, dest_permissions
         if permission_ids:
             assign_endpoint = f"{client.base_url}/identity/resources/roles/v1/{dest_role_id}/permissions"
             assign_data = {"permissionIds": permission_ids}
-            headers_with_tenant = headers.copy()
-            if role.get('tenantId'):
-                headers_with_tenant['frontegg-tenant-id'] = role['tenantId']
+            headers_with_tenant = role_headers(client.token, role.get('tenantId'))
 
             try:
                 response = make_request_with_rate_limiting('PUT', assign_endpoint, client, headers=headers_with_tenant, json_data=assign_data)
                 log(f"Permissions assigned to role '{role['name']}' (ID: {dest_role_id}) with status: {response.status_code}")
             except requests.exceptions.HTTPError as e:
                 log(f"Error assigning permissions to role '{role['name']}' (ID: {dest_role_id}): {e}")
-                if e.response:
+                if e.response is not None:
                     error_content = e.response.json()
                     log(f"Error response content:\n{json.dumps(error_content, indent=2)}")
                 else:
@@ -212,11 +221,11 @@ def migrate_roles(source_client, destination_client):
     source_permissions_by_id = {p['id']: p for p in source_permissions}
     dest_permissions_by_key = {p['key']: p['id'] for p in dest_permissions}
 
-    dest_role_keys = {role['key'] for role in (dest_roles_with_tenant + dest_roles_without_tenant)}
+    dest_role_keys = frozenset(role['key'] for role in chain(dest_roles_with_tenant, dest_roles_without_tenant))
 
     unique_roles = {}
     # Merge both categories from source and filter out roles that already exist
-    for role in (source_roles_with_tenant + source_roles_without_tenant):
+    for role in chain(source_roles_with_tenant, source_roles_without_tenant):
         role_key = role['key']
         if role_key in dest_role_keys:
             log(f"Role '{role_key}' already exists in destination. Skipping.")
@@ -237,8 +246,10 @@ def migrate_roles(source_client, destination_client):
     unique_roles_list = list(unique_roles.values())
     if unique_roles_list:
         # Separate the unique roles into those with and without tenantId
-        unique_roles_with_tenant = [role for role in unique_roles_list if role.get('tenantId')]
-        unique_roles_without_tenant = [role for role in unique_roles_list if not role.get('tenantId')]
+        unique_roles_with_tenant = []
+        unique_roles_without_tenant = []
+        for role in unique_roles_list:
+            (unique_roles_with_tenant if role.get('tenantId') else unique_roles_without_tenant).append(role)
         # Create only the new (filtered) roles in the destination
         role_id_mapping = create_roles(destination_client, unique_roles_with_tenant, unique_roles_without_tenant)
         assign_permissions_to_roles(destination_client, unique_roles_list, role_id_mapping, dest_permissions_by_key)
@@ -1,6 +1,12 @@
+import hashlib
 import json
-import time
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
+from utility.rate_limiter import TokenBucket
+from utility.utils import write_private_json
 
 # Security rule endpoints
 SECURITY_RULES = {
@@ -15,43 +21,70 @@ SECURITY_RULES = {
     'country-restriction': 'Country Restrictions'
 }
 
-# Rate limit configuration
+# Server-managed metadata that always differs between accounts
+IGNORED_RULE_FIELDS = frozenset(('id', 'createdAt', 'updatedAt'))
+
+# Last-seen ETag and body of every fetched rule, so unchanged rules come back as 304 Not Modified
+RULES_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "frontegg_migration", "security_rules")
+
+# Rules are fetched and updated concurrently; each rule has its own endpoint and rate limit slot
+SECURITY_RULE_WORKERS = 8
+
+# Rate limit configuration (requests per minute, and how many may be sent back to back)
 DEFAULT_RATE_LIMIT = 30
-last_request_times = {}
+DEFAULT_RATE_BURST = 5
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
 
-def get_headers(client):
-    """Generate headers with the client token."""
+@lru_cache(maxsize=4)
+def headers_for_token(token):
+    """Build the request headers once per token; callers must not mutate the result."""
     return {
-        "Authorization": f"Bearer {client.token}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
 
+def get_headers(client):
+    """Generate headers with the client token."""
+    return headers_for_token(client.token)
+
 def enforce_rate_limit(endpoint, rate_limit=DEFAULT_RATE_LIMIT):
-    """Enforce the rate limit for a specific endpoint."""
-    interval = 60 / rate_limit
-    
-    if endpoint in last_request_times:
-        time_since_last_request = time.time() - last_request_times[endpoint]
-        if time_since_last_request < interval:
-            time.sleep(interval - time_since_last_request)
-    
-    last_request_times[endpoint] = time.time()
+    """Wait for a request slot on the endpoint's shared token bucket."""
+    with rate_limiters_lock:
+        bucket = rate_limiters.get(endpoint)
+        if bucket is None:
+            bucket = rate_limiters[endpoint] = TokenBucket(rate_limit / 60, DEFAULT_RATE_BURST)
+    bucket.acquire()
 
 def make_request_with_rate_limiting(method, url, client, headers=None, json_data=None):
     """Handle rate-limited requests."""
     enforce_rate_limit(url)
     try:
         response = client.session.request(method, url, headers=headers, json=json_data)
-        if response.status_code == 429:
-            log_warning("⚠ Rate limit exceeded. Retrying after delay...")
-            time.sleep(60)
-            response = client.session.request(method, url, headers=headers, json=json_data)
         response.raise_for_status()
         return response
     except Exception as e:
         log_error(f"Request failed: {e}")
         raise
 
+def rule_cache_path(client, endpoint):
+    digest = hashlib.sha1(f"{client.client_id}:{endpoint}".encode()).hexdigest()
+    return os.path.join(RULES_CACHE_DIR, f"{digest}.json")
+
+def load_cached_rule(path):
+    """Returns the cached {'etag', 'body'} entry for a rule, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached_rule(path, etag, data):
+    try:
+        write_private_json(path, {'etag': etag, 'body': data})
+    except OSError as e:
+        get_logger().debug(f"Could not cache security rule: {e}")
+
 def get_security_rule(client, rule_type):
     """Fetch a specific security rule configuration."""
     logger = get_logger()
@@ -60,11 +93,21 @@ def get_security_rule(client, rule_type):
     
     endpoint = f"{client.base_url}/security-engines/resources/policies/v1/{rule_type}"
     headers = get_headers(client)
+    cache_path = rule_cache_path(client, endpoint)
+    cached = load_cached_rule(cache_path)
+    if cached:
+        headers = {**headers, 'If-None-Match': cached['etag']}
     
     try:
         response = make_request_with_rate_limiting('GET', endpoint, client, headers=headers)
+        if response.status_code == 304 and cached:
+            logger.debug(f"{rule_name} unchanged since the last run")
+            return cached['body']
         data = response.json()
         logger.debug(f"Retrieved {rule_name}: {data}")
+        etag = response.headers.get('ETag')
+        if etag:
+            save_cached_rule(cache_path, etag, data)
         return data
     except Exception as e:
         log_warning(f"Failed to fetch {rule_name}: {e}")
@@ -107,12 +150,11 @@ def compare_rules(source_rule, dest_rule):
     if not source_rule or not dest_rule:
         return False
 
-    ignored_fields = {'id', 'createdAt', 'updatedAt'}
-
-    def normalize(rule):
-        return {k: v for k, v in rule.items() if k not in ignored_fields}
-
-    return normalize(source_rule) == normalize(dest_rule)
+    # Same configuration keys, then stop at the first differing value
+    source_keys = source_rule.keys() - IGNORED_RULE_FIELDS
+    if source_keys != dest_rule.keys() - IGNORED_RULE_FIELDS:
+        return False
+    return all(source_rule[key] == dest_rule[key] for key in source_keys)
 
 def migrate_security_rules(source_client, destination_client):
     """Migrate all security rules from source to destination."""
@@ -127,23 +169,32 @@ def migrate_security_rules(source_client, destination_client):
         'failed': 0
     }
     
-    log_subsection("Fetching Security Rules from Source")
+    log_subsection("Fetching Security Rules")
     source_rules = {}
+    dest_rules = {}
     
-    # Fetch all security rules from source
-    progress, task = logger.start_progress(len(SECURITY_RULES), "Fetching source security rules")
+    # Fetch every rule from source and destination concurrently; progress is only touched from this thread
+    progress, task = logger.start_progress(2 * len(SECURITY_RULES), "Fetching security rules")
     
-    for rule_type, rule_name in SECURITY_RULES.items():
-        logger.update_progress(1, f"Fetching: {rule_name}")
-        rule_config = get_security_rule(source_client, rule_type)
-        if rule_config:
-            source_rules[rule_type] = rule_config
-            migration_results['fetched'] += 1
-        else:
-            log_warning(f"⚠ Could not fetch {rule_name} from source")
+    with ThreadPoolExecutor(max_workers=SECURITY_RULE_WORKERS) as executor:
+        futures = {}
+        for rule_type in SECURITY_RULES:
+            futures[executor.submit(get_security_rule, source_client, rule_type)] = (source_rules, rule_type)
+            futures[executor.submit(get_security_rule, destination_client, rule_type)] = (dest_rules, rule_type)
+        
+        for future in as_completed(futures):
+            rules, rule_type = futures[future]
+            logger.update_progress(1, f"Fetched: {SECURITY_RULES[rule_type]}")
+            rules[rule_type] = future.result()
     
     logger.stop_progress()
     
+    for rule_type, rule_name in SECURITY_RULES.items():
+        if not source_rules[rule_type]:
+            log_warning(f"⚠ Could not fetch {rule_name} from source")
+            del source_rules[rule_type]
+    migration_results['fetched'] = len(source_rules)
+    
     if not source_rules:
         log_error("No security rules found in source account")
         return
@@ -153,41 +204,47 @@ def migrate_security_rules(source_client, destination_client):
     # Compare and update destination rules
     log_subsection("Comparing and Updating Destination Rules")
     
-    progress, task = logger.start_progress(len(source_rules), "Updating destination security rules")
-    
+    rules_to_update = []
     for rule_type, source_config in source_rules.items():
-        rule_name = SECURITY_RULES.get(rule_type, rule_type)
-        logger.update_progress(1, f"Processing: {rule_name}")
-        
-        # Get current destination configuration
-        dest_config = get_security_rule(destination_client, rule_type)
-        
-        # Compare configurations
-        if compare_rules(source_config, dest_config):
-            logger.debug(f"{rule_name} is already up to date")
+        if compare_rules(source_config, dest_rules[rule_type]):
+            logger.debug(f"{SECURITY_RULES[rule_type]} is already up to date")
             migration_results['skipped'] += 1
         else:
-            # Update destination with source configuration
-            logger.info(f"📝 Updating {rule_name}")
-            result = update_security_rule(destination_client, rule_type, source_config)
+            rules_to_update.append(rule_type)
+    
+    updated_rules = []
+    progress, task = logger.start_progress(len(rules_to_update), "Updating destination security rules")
+    
+    with ThreadPoolExecutor(max_workers=SECURITY_RULE_WORKERS) as executor:
+        futures = {}
+        for rule_type in rules_to_update:
+            logger.info(f"📝 Updating {SECURITY_RULES[rule_type]}")
+            futures[executor.submit(update_security_rule, destination_client, rule_type, source_rules[rule_type])] = rule_type
+        
+        for future in as_completed(futures):
+            rule_type = futures[future]
+            rule_name = SECURITY_RULES[rule_type]
+            source_config = source_rules[rule_type]
+            dest_config = dest_rules[rule_type]
+            logger.update_progress(1, f"Processed: {rule_name}")
             
-            if result:
+            if future.result():
                 migration_results['updated'] += 1
+                updated_rules.append(rule_name)
                 
                 # Log the specific changes made
-                if dest_config and source_config:
-                    if isinstance(source_config, dict) and isinstance(dest_config, dict):
-                        # Check for common fields that might have changed
-                        if 'enabled' in source_config and 'enabled' in dest_config:
-                            if source_config['enabled'] != dest_config.get('enabled'):
-                                status = "Enabled" if source_config['enabled'] else "Disabled"
-                                logger.info(f"  → {status} {rule_name}")
-                        
-                        if 'action' in source_config and source_config.get('action') != dest_config.get('action'):
-                            logger.info(f"  → Action changed to: {source_config.get('action')}")
-                        
-                        if 'threshold' in source_config and source_config.get('threshold') != dest_config.get('threshold'):
-                            logger.info(f"  → Threshold changed to: {source_config.get('threshold')}")
+                if isinstance(source_config, dict) and isinstance(dest_config, dict):
+                    # Check for common fields that might have changed
+                    if 'enabled' in source_config and 'enabled' in dest_config:
+                        if source_config['enabled'] != dest_config.get('enabled'):
+                            status = "Enabled" if source_config['enabled'] else "Disabled"
+                            logger.info(f"  → {rule_name}: {status}")
+                    
+                    if 'action' in source_config and source_config.get('action') != dest_config.get('action'):
+                        logger.info(f"  → {rule_name}: action changed to {source_config.get('action')}")
+                    
+                    if 'threshold' in source_config and source_config.get('threshold') != dest_config.get('threshold'):
+                        logger.info(f"  → {rule_name}: threshold changed to {source_config.get('threshold')}")
             else:
                 migration_results['failed'] += 1
     
@@ -202,15 +259,8 @@ def migrate_security_rules(source_client, destination_client):
     })
     
     # Show which rules were updated
-    if migration_results['updated'] > 0:
-        updated_rules = []
-        for rule_type in source_rules:
-            dest_config = get_security_rule(destination_client, rule_type)
-            if not compare_rules(source_rules[rule_type], dest_config):
-                updated_rules.append(SECURITY_RULES.get(rule_type, rule_type))
-        
-        if updated_rules:
-            logger.print_summary(updated_rules, "Updated Security Rules")
+    if updated_rules:
+        logger.print_summary(updated_rules, "Updated Security Rules")
     
     if migration_results['failed'] == 0:
         log_success("✅ Security rules migration completed successfully!")
@@ -1,52 +1,85 @@
 import json
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
+from utility.rate_limiter import TokenBucket
 
-# Rate limit configuration
+# Rate limit configuration (requests per minute, and how many may be sent back to back)
 DEFAULT_RATE_LIMIT = 30  # Default to 30 requests per minute
+DEFAULT_RATE_BURST = 5
 RATE_LIMITS = {
     # Custom rate limits for specific endpoints can be specified here
     # 'https://api.frontegg.com/tenants/resources/tenants/v1': 30,
 }
 
-# Track the timestamps of requests for each endpoint
-last_request_times = {}
+# One token bucket per endpoint, shared by every thread calling it
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
 
-def get_headers(client):
-    """Generate headers with the client token."""
+# Tenants (and tenant metadata updates) sent concurrently; the rate limiter paces the requests
+TENANT_WORKERS = 8
+
+# Successful GET responses are reused for a few minutes, so data fetched by one migration step
+# (e.g. permissions or roles) is not fetched again by the next. A write drops the cached
+# responses of the resource it touched.
+GET_CACHE_TTL = 300
+get_cache = {}
+get_cache_lock = threading.Lock()
+RESOURCE_VERSION_PATTERN = re.compile(r'/v\d+(?:/|\?|$)')
+
+@lru_cache(maxsize=4)
+def headers_for_token(token):
+    """Build the request headers once per token; callers must not mutate the result."""
     return {
-        "Authorization": f"Bearer {client.token}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
 
+def get_headers(client):
+    """Generate headers with the client token."""
+    return headers_for_token(client.token)
+
 def get_rate_limit(endpoint):
     """Get the rate limit for the endpoint, or use the default."""
     return RATE_LIMITS.get(endpoint, DEFAULT_RATE_LIMIT)
 
 def enforce_rate_limit(endpoint):
-    """Enforce the rate limit for a specific endpoint."""
-    rate_limit = get_rate_limit(endpoint)
-    interval = 60 / rate_limit  # Time in seconds between requests
+    """Wait for a request slot on the endpoint's shared token bucket."""
+    with rate_limiters_lock:
+        bucket = rate_limiters.get(endpoint)
+        if bucket is None:
+            bucket = rate_limiters[endpoint] = TokenBucket(get_rate_limit(endpoint) / 60, DEFAULT_RATE_BURST)
+    bucket.acquire()
 
-    if endpoint in last_request_times:
-        time_since_last_request = time.time() - last_request_times[endpoint]
-        if time_since_last_request < interval:
-            # Wait for the required interval to avoid exceeding the rate limit
-            time.sleep(interval - time_since_last_request)
-
-    # Update the last request time for this endpoint
-    last_request_times[endpoint] = time.time()
+def resource_scope(url):
+    """The part of a URL before its API version, e.g. ".../identity/resources/roles" for any roles endpoint."""
+    match = RESOURCE_VERSION_PATTERN.search(url)
+    return url[:match.start()] if match else url
 
 def make_request_with_rate_limiting(method, url, client, headers=None, json_data=None):
-    """Handle rate-limited requests."""
+    """Handle rate-limited requests, reusing recent GET responses."""
+    cache_key = (url, (headers or {}).get('Authorization'))
+    if method == 'GET':
+        with get_cache_lock:
+            cached = get_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            get_logger().debug(f"Using cached response for GET {url}")
+            return cached[1]
+
     enforce_rate_limit(url)
     try:
         response = client.session.request(method, url, headers=headers, json=json_data)
-        if response.status_code == 429:
-            log_warning("⚠ Rate limit exceeded. Retrying after delay...")
-            time.sleep(60)  # Wait 60 seconds when hitting rate limits (adjust as needed)
-            response = client.session.request(method, url, headers=headers, json=json_data)
         response.raise_for_status()
+        with get_cache_lock:
+            if method == 'GET':
+                get_cache[cache_key] = (time.monotonic() + GET_CACHE_TTL, response)
+            else:
+                scope = resource_scope(url)
+                for key in [key for key in get_cache if resource_scope(key[0]) == scope]:
+                    del get_cache[key]
         return response
     except Exception as e:
         log_error(f"Request failed: {e}")
@@ -109,9 +142,12 @@ def bulk_create_tenants(destination_client, tenants):
     
     if new_tenants:
         progress, task = logger.start_progress(len(new_tenants), "Creating tenants")
-        for tenant in new_tenants:
-            create_tenant(destination_client, tenant)
-            logger.update_progress(1, f"Creating: {tenant['tenantId']}")
+        with ThreadPoolExecutor(max_workers=TENANT_WORKERS) as executor:
+            futures = {executor.submit(create_tenant, destination_client, tenant): tenant for tenant in new_tenants}
+            # Progress is only touched from this thread
+            for future in as_completed(futures):
+                future.result()
+                logger.update_progress(1, f"Created: {futures[future]['tenantId']}")
         logger.stop_progress()
     
     logger.print_stats("Tenant Creation Summary", {
@@ -140,14 +176,20 @@ def migrate_tenants(source_client, destination_client):
         progress, task = logger.start_progress(len(tenants_with_metadata), "Updating metadata")
         
         success_count = 0
-        for tenant in tenants_with_metadata:
-            try:
-                metadata_json = json.loads(tenant['metadata'])
-                set_tenant_metadata(destination_client, tenant['tenantId'], metadata_json)
+        with ThreadPoolExecutor(max_workers=TENANT_WORKERS) as executor:
+            futures = []
+            for tenant in tenants_with_metadata:
+                try:
+                    metadata_json = json.loads(tenant['metadata'])
+                except json.JSONDecodeError:
+                    log_warning(f"⚠ Invalid metadata for tenant {tenant['tenantId']}")
+                    logger.update_progress(1)
+                    continue
+                futures.append(executor.submit(set_tenant_metadata, destination_client, tenant['tenantId'], metadata_json))
+            for future in as_completed(futures):
+                future.result()
                 success_count += 1
-            except json.JSONDecodeError:
-                log_warning(f"⚠ Invalid metadata for tenant {tenant['tenantId']}")
-            logger.update_progress(1)
+                logger.update_progress(1)
         
         logger.stop_progress()
         logger.print_stats("Metadata Migration Summary", {
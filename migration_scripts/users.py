@@ -2,136 +2,190 @@ import json
 import os
 import pandas as pd
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from functools import lru_cache
 from utility.utils import log
+from utility.logger import get_logger, log_detailed_api_call
 from migration_scripts.roles import get_roles 
+from migration_scripts.assign_roles_to_users import get_users_with_pagination
+
+# Exported users, and the transformed CSV uploaded to the destination (relative to the working directory)
+USERS_INPUT_CSV = os.path.join('account_data', 'user_migration_data.csv')
+USERS_FINAL_CSV = os.path.join('account_data', 'final_data.csv')
+
+# Bulk CSV migration form fields, serialized once
+CSV_FIELDS_MAPPER = json.dumps({
+    "name": "name",
+    "email": "email",
+    "tenantId": "tenantId",
+    "password": "passwordHash",
+    "metadata": "metadata",
+    "phoneNumber": "phoneNumber",
+    "roleIds": "roleIds"
+})
+CSV_HASHING_CONFIG = json.dumps({
+    "passwordHashType": "bcrypt"
+})
+
+# Columns every row of user_migration_data.csv needs (checked before any API call)
+REQUIRED_USER_COLUMNS = ('email', 'tenantId')
+
+# Users whose source roles are fetched concurrently when the CSV has no roleIds
+USER_ROLE_WORKERS = 8
+# Rows of user_migration_data.csv transformed and written at a time
+USERS_CSV_CHUNK_SIZE = 100_000
+
+def format_metadata(metadata):
+    try:
+        metadata_json = json.loads(metadata)
+        return json.dumps(metadata_json)
+    except (json.JSONDecodeError, TypeError):
+        return metadata
+
+def check_users_csv_columns():
+    """Read only the header of user_migration_data.csv and raise ValueError if required columns are missing."""
+    if not os.path.exists(USERS_INPUT_CSV):
+        return
+    columns = set(pd.read_csv(USERS_INPUT_CSV, nrows=0).columns.str.strip('"'))
+    missing = [column for column in REQUIRED_USER_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"{USERS_INPUT_CSV} is missing required column(s): {', '.join(missing)}")
 
-def log_detailed_api_call(method, url, headers=None, data=None):
-    """Log all details of the API call."""
-    log(f"API CALL: {method} {url}")
-    if headers:
-        log(f"Headers: {json.dumps(headers, indent=2)}")
-    if data:
-        log(f"Data Payload: {json.dumps(data, indent=2)}")
+def create_final_csv(chunksize=USERS_CSV_CHUNK_SIZE):
+    """Read user_migration_data.csv in chunks, yielding each with the required transformations applied.
 
-def create_final_csv():
-    """Generate final_data.csv from user_migration_data.csv with required transformations."""
-    input_path = os.path.join(os.getcwd(), 'account_data', 'user_migration_data.csv')
-    output_path = os.path.join(os.getcwd(), 'account_data', 'final_data.csv')
+    Yields nothing if the input file is missing.
+    """
+    input_path = USERS_INPUT_CSV
 
     if not os.path.exists(input_path):
         log(f"Input CSV file not found at {input_path}. Please check the file path.")
         return
 
-    df = pd.read_csv(input_path, dtype={'phoneNumber': str})  # Ensure phoneNumber is read as a string
-    df.columns = [col.strip('"') for col in df.columns]
-
-    def format_metadata(metadata):
-        try:
-            metadata_json = json.loads(metadata)
-            return json.dumps(metadata_json)
-        except (json.JSONDecodeError, TypeError):
-            return metadata
-
-    if 'metadata' in df.columns:
-        df['metadata'] = df['metadata'].fillna("{}").apply(format_metadata)
+    # Ensure phoneNumber is read as a string
+    for df in pd.read_csv(input_path, dtype={'phoneNumber': str}, chunksize=chunksize):
+        df.columns = df.columns.str.strip('"')
 
-    return df  # Return DataFrame without formatting phone numbers
+        if 'metadata' in df.columns:
+            df['metadata'] = [format_metadata(metadata) for metadata in df['metadata'].fillna("{}").tolist()]
 
-def finalize_csv(df):
-    """Finalizes the CSV by formatting phone numbers and saving the file."""
-    output_path = os.path.join(os.getcwd(), 'account_data', 'final_data.csv')
-
-    def format_phone_number(phone):
-        """Format phone numbers by ensuring they are treated as strings and prefixed with '+'."""
-        if pd.isna(phone):
-            return ""
-        phone_str = str(phone).split('.')[0]  # Remove any decimals introduced by reading as float
-        return f"+{phone_str}" if not phone_str.startswith("+") else phone_str
+        yield df  # Yield chunks without formatting phone numbers
 
+def finalize_csv(df, output_path, first_chunk):
+    """Formats phone numbers in a chunk and writes it to the final CSV (appending after the first chunk)."""
     if 'phoneNumber' in df.columns:
-        df['phoneNumber'] = df['phoneNumber'].apply(format_phone_number)
+        # Format phone numbers as strings prefixed with '+'; missing numbers become ""
+        phones = df['phoneNumber']
+        phone_str = phones.astype(str).str.split('.', n=1).str[0]  # Remove any decimals introduced by reading as float
+        phone_str = phone_str.where(phone_str.str.startswith('+'), '+' + phone_str)
+        df['phoneNumber'] = phone_str.mask(phones.isna(), '')
+
+    df.to_csv(output_path, mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+
+def translate_role_ids(source_role_ids, role_id_mapping):
+    """Translate a Series of source role ID lists into pipe-separated destination role IDs.
+
+    role_id_mapping is a dict or a Series indexed by source role ID.
+
+    Unmapped and empty IDs are dropped; rows without any destination role get "".
+    """
+    exploded = source_role_ids.explode().dropna().astype(str).str.strip()
+    translated = exploded.map(role_id_mapping).dropna()
+    return translated.groupby(level=0).agg('|'.join).reindex(source_role_ids.index, fill_value='')
+
+def fetch_source_user_ids(client):
+    """Map every source user's email to its ID with one paginated listing (200 users per request)."""
+    return {
+        user['email'].strip(): user['id']
+        for user in get_users_with_pagination(client) if user.get('email') and user.get('id')
+    }
 
-    df.to_csv(output_path, index=False)
-    log(f"Generated transformed CSV file at {output_path}")
-    return output_path
+def fetch_source_role_ids(client, email, tenant_id, email_to_user_id):
+    """Fetch the source role IDs of a user, or an empty list if the user is not found.
+
+    Emails missing from the prefetched mapping fall back to a per-user lookup.
+    """
+    user_id = email_to_user_id.get(email) or get_user_id_by_email(client, email, tenant_id)
+    if not user_id:
+        log(f"User ID not found for {email} in source client.")
+        return []
+    return get_user_roles(client, user_id, tenant_id)
+
+def resolve_role_ids(source_client, df, role_id_mapping, csv_has_roles, email_to_user_id=None):
+    """Fill a chunk's roleIds column with pipe-separated destination role IDs.
+
+    Without roleIds in the CSV, each user's roles are fetched from the source account;
+    email_to_user_id (from fetch_source_user_ids) saves a lookup per user.
+    """
+    if csv_has_roles:
+        # Parse pipe-separated role IDs from CSV
+        source_role_ids = df['roleIds'].fillna('').astype(str).str.split('|')
+    else:
+        # Fetch the source roles of each distinct (email, tenantId) pair concurrently; map() keeps the order
+        unique_pairs = df[['email', 'tenantId']].drop_duplicates()
+        emails, tenant_ids = unique_pairs['email'].tolist(), unique_pairs['tenantId'].tolist()
+        with ThreadPoolExecutor(max_workers=USER_ROLE_WORKERS) as executor:
+            fetched = executor.map(fetch_source_role_ids, repeat(source_client),
+                                   emails, tenant_ids, repeat(email_to_user_id))
+            roles_by_pair = dict(zip(zip(emails, tenant_ids), fetched))
+        # Map the results back onto every row, duplicates included
+        source_role_ids = pd.Series([roles_by_pair.get(pair, []) for pair in zip(df['email'], df['tenantId'])],
+                                    index=df.index)
+
+    # Translate from source to destination role IDs
+    df["roleIds"] = translate_role_ids(source_role_ids, role_id_mapping)
+    return int((df['roleIds'] != '').sum())
 
 def create_users_in_destination(source_client, destination_client, migrate_user_roles):
     """Create users in the destination account with role assignment based on mapped roles."""
-    df = create_final_csv()  # Read initial transformations without formatting phone numbers
+    # Fail on a malformed export before fetching roles or users
+    check_users_csv_columns()
 
     if migrate_user_roles:
-        # Get a merged list of roles instead of a tuple.
-        source_roles = get_roles(source_client, split=False)
-        dest_roles = get_roles(destination_client, split=False)
+        # Get a merged list of roles instead of a tuple, from both accounts in parallel.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(get_roles, source_client, split=False)
+            dest_future = executor.submit(get_roles, destination_client, split=False)
+            source_roles, dest_roles = source_future.result(), dest_future.result()
 
-        # Map destination role IDs based on matching role names
+        # Map destination role IDs based on matching role names (a single hash lookup per source role)
         role_name_to_dest_id = {dest_role['name']: dest_role['id'] for dest_role in dest_roles}
-        role_id_mapping = {src_role['id']: role_name_to_dest_id.get(src_role['name'])
+        role_id_mapping = {src_role['id']: role_name_to_dest_id[src_role['name']]
                            for src_role in source_roles if src_role['name'] in role_name_to_dest_id}
 
         log(f"Role ID Mapping: {role_id_mapping}")
-
-        # CHECK: Does the CSV already have roleIds from DB export?
-        csv_has_roles = 'roleIds' in df.columns and not df['roleIds'].isna().all()
-
-        if csv_has_roles:
-            log("✓ Found existing roleIds in CSV (from DB export) - using them directly")
-            log("✓ Skipping API calls to fetch user roles")
-
-            roles_for_csv = []
-            for idx, row in df.iterrows():
-                existing_role_ids = str(row.get('roleIds', ''))
-
-                if existing_role_ids and existing_role_ids != 'nan':
-                    # Parse pipe-separated role IDs from CSV
-                    source_role_ids = [rid.strip() for rid in existing_role_ids.split('|') if rid.strip()]
-
-                    # Translate from source to destination role IDs
-                    translated_role_ids = [
-                        role_id_mapping.get(role_id)
-                        for role_id in source_role_ids
-                        if role_id_mapping.get(role_id)
-                    ]
-
-                    roles_string = "|".join(translated_role_ids) if translated_role_ids else ""
-                    roles_for_csv.append(roles_string)
-
-                    email = row.get("email", "unknown")
-                    log(f"User {email} - Mapped {len(source_role_ids)} roles -> {len(translated_role_ids)} destination roles")
+        # Built once so each chunk's Series.map reuses the same hash table
+        role_id_mapping = pd.Series(role_id_mapping, dtype=object)
+
+    # Transform, resolve roles and write the final CSV one chunk at a time
+    csv_file_path = USERS_FINAL_CSV
+    csv_has_roles = None
+    email_to_user_id = None
+    user_count = users_with_roles = 0
+    for chunk_number, df in enumerate(create_final_csv()):
+        if migrate_user_roles:
+            if csv_has_roles is None:
+                # CHECK: Does the CSV already have roleIds from DB export? (decided on the first chunk)
+                csv_has_roles = 'roleIds' in df.columns and not df['roleIds'].isna().all()
+                if csv_has_roles:
+                    log("✓ Found existing roleIds in CSV (from DB export) - using them directly")
+                    log("✓ Skipping API calls to fetch user roles")
                 else:
-                    roles_for_csv.append("")
+                    log("✓ No roleIds found in CSV - fetching from source account API")
+                    email_to_user_id = fetch_source_user_ids(source_client)
+                    log(f"Resolved {len(email_to_user_id)} source user IDs by email")
+            users_with_roles += resolve_role_ids(source_client, df, role_id_mapping, csv_has_roles, email_to_user_id)
 
-            df["roleIds"] = roles_for_csv
+        # Finalize the chunk with formatted phone numbers
+        finalize_csv(df, csv_file_path, first_chunk=chunk_number == 0)
+        user_count += len(df)
 
-        else:
-            log("✓ No roleIds found in CSV - fetching from source account API")
-
-            roles_for_csv = []
-
-            for idx, row in df.iterrows():
-                email = row["email"]
-                tenant_id = row["tenantId"]
-
-                # Fetch user ID from the source client
-                user_id = get_user_id_by_email(source_client, email, tenant_id)
-
-                if user_id:
-                    source_role_ids = get_user_roles(source_client, user_id, tenant_id)
-                    translated_role_ids = [role_id_mapping.get(role_id) for role_id in source_role_ids if role_id_mapping.get(role_id)]
-
-                    log(f"User {email} - Translated Role IDs: {translated_role_ids}")
-
-                    roles_string = "|".join(translated_role_ids) if translated_role_ids else ""
-                    roles_for_csv.append(roles_string)
-                else:
-                    log(f"User ID not found for {email} in source client.")
-                    roles_for_csv.append("")
-
-            # Add the new 'roleIds' column to the DataFrame
-            df["roleIds"] = roles_for_csv
-
-    # Finalize the CSV with formatted phone numbers
-    csv_file_path = finalize_csv(df)
+    if not user_count:
+        return
+    if migrate_user_roles:
+        log(f"Mapped roles for {user_count} users; {users_with_roles} have destination roles")
+    log(f"Generated transformed CSV file at {csv_file_path}")
     initiate_csv_migration(destination_client, csv_file_path)
 
 def initiate_csv_migration(client, csv_file_path):
@@ -144,19 +198,8 @@ def initiate_csv_migration(client, csv_file_path):
         'frontegg-environment-id': client.client_id
     }
 
-    fields_mapper = json.dumps({
-        "name": "name",
-        "email": "email",
-        "tenantId": "tenantId",
-        "password": "passwordHash",
-        "metadata": "metadata",
-        "phoneNumber": "phoneNumber",
-        "roleIds": "roleIds"
-    })
-
-    hashing_config = json.dumps({
-        "passwordHashType": "bcrypt"
-    })
+    fields_mapper = CSV_FIELDS_MAPPER
+    hashing_config = CSV_HASHING_CONFIG
 
     try:
         with open(csv_file_path, 'rb') as csv_file:
@@ -165,16 +208,16 @@ def initiate_csv_migration(client, csv_file_path):
                 'fieldsMapper': (None, fields_mapper, 'application/json'),
                 'hashingConfig': (None, hashing_config, 'application/json')
             }
-            log_detailed_api_call("POST", endpoint, headers=headers, data={
-                'fieldsMapper': fields_mapper,
-                'hashingConfig': hashing_config
-            })
-            response = requests.post(endpoint, headers=headers, files=files)
+            response = client.session.post(endpoint, headers=headers, files=files)
             log(f"Users created: {response.status_code}")
             log(f"Response Content:\n{response.text}\n")
             response.raise_for_status()
     except requests.exceptions.HTTPError as e:
         log(f"Error creating users: {e}")
+        log_detailed_api_call("POST", endpoint, headers=headers, data={
+            'fieldsMapper': fields_mapper,
+            'hashingConfig': hashing_config
+        })
         if e.response is not None:
             log(f"Error response content:\n{e.response.text}")
         raise
@@ -192,23 +235,32 @@ def migrate_users(source_client, destination_client, migrate_users_flag, migrate
         create_users_in_destination(source_client, destination_client, migrate_user_roles)
         log("Users and roles have been set up in final_data.csv")
 
+@lru_cache(maxsize=1024)
+def tenant_headers(token, tenant_id):
+    """Build the request headers once per token and tenant; callers must not mutate the result."""
+    return {
+        'Authorization': f'Bearer {token}',
+        'frontegg-tenant-id': tenant_id
+    }
+
 def get_user_id_by_email(client, email, tenant_id):
     """Fetch user ID by email and tenantId, with detailed API call and response logging for troubleshooting."""
     endpoint = f"{client.base_url}/identity/resources/users/v3?_email={email}"
-    headers = {'Authorization': f'Bearer {client.token}', 'frontegg-tenant-id': tenant_id}
+    headers = tenant_headers(client.token, tenant_id)
 
-    # Log the API call details
-    log(f"Fetching user ID for {email} with tenant ID {tenant_id}")
-    log(f"API Endpoint: {endpoint}")
-    log(f"Headers: {json.dumps(headers, indent=2)}")
+    # Log the API call details (debug level, formatted only when the record is emitted)
+    logger = get_logger()
+    logger.debug("Fetching user ID for %s with tenant ID %s", email, tenant_id)
+    logger.debug("API Endpoint: %s", endpoint)
+    logger.debug("Headers: %s", headers)
 
     try:
-        response = requests.get(endpoint, headers=headers)
+        response = client.session.get(endpoint, headers=headers)
         response.raise_for_status()
 
         # Log the raw response for debugging
-        log(f"Response Status Code: {response.status_code}")
-        log(f"Response Content: {response.text}")
+        logger.debug("Response Status Code: %s", response.status_code)
+        logger.debug("Response Content: %s", response.text)
 
         # Parse the JSON response correctly
         users = response.json().get("items", [])
@@ -223,10 +275,10 @@ def get_user_id_by_email(client, email, tenant_id):
 def get_user_roles(client, user_id, tenant_id):
     """Fetch role IDs for a user within a tenant."""
     endpoint = f"{client.base_url}/identity/resources/users/v3/roles?ids={user_id}"
-    headers = {'Authorization': f'Bearer {client.token}', 'frontegg-tenant-id': tenant_id}
+    headers = tenant_headers(client.token, tenant_id)
 
     try:
-        response = requests.get(endpoint, headers=headers)
+        response = client.session.get(endpoint, headers=headers)
         response.raise_for_status()
         roles_info = response.json()
         return roles_info[0].get("roleIds", []) if roles_info else []
@@ -1,15 +1,11 @@
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from utility.logger import get_logger, log_success, log_error, log_warning, log_subsection
-import os
-from dotenv import load_dotenv
+from utility.settings import get_settings
 import time
 
-# Load environment variables
-load_dotenv()
-
-# Migration flag
-MIGRATE_PREHOOKS = os.getenv("MIGRATE_PREHOOKS", "False").lower() == "true"
+# Webhooks deleted or migrated concurrently
+WEBHOOK_WORKERS = 8
 
 def get_webhooks(client):
     """Fetches all webhook configurations from the account."""
@@ -21,7 +17,7 @@ def get_webhooks(client):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             webhooks = response.json()
             logger.info(f"  Found {len(webhooks)} webhook(s)")
@@ -43,7 +39,7 @@ def get_custom_code(client, code_id):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = client.session.get(url, headers=headers)
         if response.status_code == 200:
             code_data = response.json()
             # The API returns the code in 'content' field, not 'code'
@@ -87,7 +83,7 @@ def create_custom_code_webhook(client, webhook_data, code, runtime):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = client.session.post(url, headers=headers, json=data)
         if response.status_code in [200, 201]:
             logger.debug(f"  ✓ Created custom code webhook: {webhook_data.get('displayName')}")
             return True
@@ -124,7 +120,7 @@ def create_api_webhook(client, webhook_data):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = client.session.post(url, headers=headers, json=data)
         if response.status_code in [200, 201]:
             logger.debug(f"  ✓ Created API webhook: {webhook_data.get('displayName')}")
             return True
@@ -145,7 +141,7 @@ def delete_webhook(client, webhook_id):
     }
     
     try:
-        response = requests.delete(url, headers=headers)
+        response = client.session.delete(url, headers=headers)
         if response.status_code in [200, 204]:
             return True
         else:
@@ -155,11 +151,35 @@ def delete_webhook(client, webhook_id):
         logger.debug(f"  Error deleting webhook: {e}")
         return False
 
+def migrate_webhook(source_client, destination_client, webhook):
+    """Creates a single source webhook in the destination; returns True on success."""
+    logger = get_logger()
+    webhook_name = webhook.get('displayName', 'Unknown')
+    webhook_type = webhook.get('type', 'Unknown')
+    
+    if webhook_type == "CUSTOM_CODE":
+        # Get the custom code content
+        executor_id = webhook.get('executorIdentifier')
+        if not executor_id:
+            logger.error(f"  ✗ No executor ID for custom code webhook {webhook_name}")
+            return False
+        code, runtime = get_custom_code(source_client, executor_id)
+        if not code:
+            logger.error(f"  ✗ Could not retrieve code for {webhook_name}")
+            return False
+        return bool(create_custom_code_webhook(destination_client, webhook, code, runtime))
+    
+    if webhook_type == "API":
+        return bool(create_api_webhook(destination_client, webhook))
+    
+    logger.warning(f"  ⚠ Unknown webhook type: {webhook_type}")
+    return False
+
 def migrate_webhooks(source_client, destination_client):
     """Migrates webhooks from source to destination."""
     logger = get_logger()
     
-    if not MIGRATE_PREHOOKS:
+    if not get_settings().MIGRATE_PREHOOKS:
         log_warning("Prehooks migration is disabled (MIGRATE_PREHOOKS=False)")
         return
     
@@ -180,8 +200,10 @@ def migrate_webhooks(source_client, destination_client):
     # Delete existing webhooks in destination if any
     if dest_webhooks:
         logger.info(f"🗑️  Deleting {len(dest_webhooks)} existing webhook(s) in destination...")
-        for webhook in dest_webhooks:
-            delete_webhook(destination_client, webhook['id'])
+        with ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS) as executor:
+            futures = [executor.submit(delete_webhook, destination_client, webhook['id']) for webhook in dest_webhooks]
+            for future in as_completed(futures):
+                future.result()
         time.sleep(1)  # Give the API a moment
     
     # Migrate webhooks
@@ -190,29 +212,16 @@ def migrate_webhooks(source_client, destination_client):
     
     logger.start_progress(len(source_webhooks), "Migrating webhooks")
     
-    for webhook in source_webhooks:
-        webhook_name = webhook.get('displayName', 'Unknown')
-        webhook_type = webhook.get('type', 'Unknown')
-        logger.update_progress(description=f"Migrating {webhook_name}")
-        
-        if webhook_type == "CUSTOM_CODE":
-            # Get the custom code content
-            executor_id = webhook.get('executorIdentifier')
-            if executor_id:
-                code, runtime = get_custom_code(source_client, executor_id)
-                if code:
-                    if create_custom_code_webhook(destination_client, webhook, code, runtime):
-                        success_count += 1
-                else:
-                    logger.error(f"  ✗ Could not retrieve code for {webhook_name}")
-            else:
-                logger.error(f"  ✗ No executor ID for custom code webhook {webhook_name}")
-                
-        elif webhook_type == "API":
-            if create_api_webhook(destination_client, webhook):
+    with ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS) as executor:
+        futures = {
+            executor.submit(migrate_webhook, source_client, destination_client, webhook): webhook
+            for webhook in source_webhooks
+        }
+        # Progress is only touched from this thread
+        for future in as_completed(futures):
+            logger.update_progress(description=f"Migrated {futures[future].get('displayName', 'Unknown')}")
+            if future.result():
                 success_count += 1
-        else:
-            logger.warning(f"  ⚠ Unknown webhook type: {webhook_type}")
     
     logger.stop_progress()
     
@@ -0,0 +1,52 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from migration_scripts import groups
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Serves users in pages whose _offset is a page index, like the users API."""
+
+    def __init__(self, users, page_size):
+        self.users = users
+        self.page_size = page_size
+        self.requested_params = []
+
+    def get(self, url, headers=None, params=None):
+        self.requested_params.append(dict(params))
+        page = int(params.get('_offset', 0))
+        start = page * self.page_size
+        items = self.users[start:start + self.page_size]
+        links = {}
+        if start + self.page_size < len(self.users):
+            links['next'] = f"{url}?_limit={self.page_size}&_offset={page + 1}"
+        return FakeResponse({'items': items, '_links': links})
+
+
+class IterUsersFromDestinationTest(unittest.TestCase):
+    def test_pages_through_every_page(self):
+        users = [{'email': f'user{i}@example.com', 'id': str(i)} for i in range(5)]
+        session = FakeSession(users, page_size=2)
+        client = SimpleNamespace(base_url='https://api.example.com', token='token', session=session)
+
+        with mock.patch.object(groups, 'USERS_PAGE_SIZE', 2):
+            fetched = list(groups.iter_users_from_destination(client, 'tenant-1'))
+
+        self.assertEqual(fetched, users)
+        self.assertEqual([params.get('_offset') for params in session.requested_params], [None, '1', '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,77 @@
+import base64
+import json
+import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from utility.logger import get_logger, log_success, log_error, log_warning
+from utility.utils import write_private_json
+
+# Keep-alive connections kept per host; covers the thread pools used by the migrators
+POOL_SIZE = 20
+
+# (connect, read) timeout in seconds applied to every request that does not pass its own
+HTTP_TIMEOUT = (3.05, 30)
+
+# Vendor tokens are reused until shortly before they expire, also across runs
+TOKEN_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "frontegg_migration", "token.json")
+TOKEN_EXPIRY_MARGIN = 60
+# A cached token is only reused if it outlives a typical run; otherwise a fresh one is fetched
+TOKEN_REUSE_MIN_TTL = 30 * 60
+_token_cache = {}
+
+def get_token_exp(token):
+    """Reads the exp claim from the token's JWT payload."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+    except (IndexError, ValueError):
+        return None
+
+def load_cached_token(base_url, client_id):
+    """Returns a cached (token, exp) pair for the account with at least TOKEN_REUSE_MIN_TTL seconds left, if any."""
+    key = f"{base_url}|{client_id}"
+    if key not in _token_cache:
+        try:
+            with open(TOKEN_CACHE_PATH) as f:
+                _token_cache.update(json.load(f))
+        except (OSError, ValueError):
+            return None
+    entry = _token_cache.get(key)
+    if entry and entry['exp'] - TOKEN_REUSE_MIN_TTL > time.time():
+        return entry['token'], entry['exp']
+    return None
+
+def save_cached_token(base_url, client_id, token, exp):
+    """Stores the token in memory and on disk (readable by the current user only)."""
+    _token_cache[f"{base_url}|{client_id}"] = {'token': token, 'exp': exp}
+    try:
+        write_private_json(TOKEN_CACHE_PATH, _token_cache)
+    except OSError as e:
+        log_warning(f"⚠ Could not write token cache: {e}")
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout so a hung endpoint cannot stall a worker forever."""
+
+    def __init__(self, *args, timeout=HTTP_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+class RateLimitRetry(Retry):
+    """Retry policy that also retries POST/PATCH on 429, since a throttled request was never processed."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
 
 class FronteggClient:
     def __init__(self, base_url, client_id, secret):
@@ -8,10 +79,34 @@ class FronteggClient:
         self.client_id = client_id
         self.secret = secret
         self.session = requests.Session()
+        self.session.mount('https://', TimeoutHTTPAdapter(
+            pool_connections=POOL_SIZE,
+            pool_maxsize=POOL_SIZE,
+            max_retries=RateLimitRetry(
+                total=5,
+                backoff_factor=1,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=frozenset(['GET', 'DELETE', 'PUT']),  # POST is not idempotent (except on 429)
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        ))
         self.token = None
         self.token_expiry = None
         self.logger = get_logger()
-        self.authenticate()  # Authenticate upon initialization
+        if not self.use_cached_token():
+            self.authenticate()  # Authenticate upon initialization
+
+    def use_cached_token(self):
+        """Reuse a still-valid token from an earlier run, if one is cached."""
+        cached = load_cached_token(self.base_url, self.client_id)
+        if not cached:
+            return False
+        self.token, exp = cached
+        self.token_expiry = datetime.utcfromtimestamp(exp - TOKEN_EXPIRY_MARGIN)
+        log_success(f"Reusing cached token for {self.base_url}")
+        self.logger.debug(f"Token expires at: {self.token_expiry}")
+        return True
 
     def authenticate(self):
         """Authenticate using client ID and secret, retrieving a token."""
@@ -30,7 +125,8 @@ class FronteggClient:
             if not token:
                 raise ValueError("Authentication failed: No token found in response.")
             self.token = token
-            self.token_expiry = datetime.utcnow() + timedelta(seconds=expires_in - 60)
+            self.token_expiry = datetime.utcnow() + timedelta(seconds=expires_in - TOKEN_EXPIRY_MARGIN)
+            save_cached_token(self.base_url, self.client_id, token, get_token_exp(token) or time.time() + expires_in)
             log_success(f"Authentication successful for {self.base_url}")
             self.logger.debug(f"Token expires at: {self.token_expiry}")
         except requests.exceptions.RequestException as e:
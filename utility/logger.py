@@ -1,6 +1,11 @@
 import os
+import atexit
+import json
 import logging
+import queue
 import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from rich.console import Console
 from rich.logging import RichHandler
@@ -25,11 +30,36 @@ class CustomFormatter(logging.Formatter):
         'CRITICAL': Fore.RED + Back.WHITE
     }
     
+    COLORED_LEVELS = {level: f"{color}{level}{Style.RESET_ALL}" for level, color in COLORS.items()}
+    
     def format(self, record):
-        log_color = self.COLORS.get(record.levelname, '')
-        record.levelname = f"{log_color}{record.levelname}{Style.RESET_ALL}"
-        record.msg = f"{log_color}{record.msg}{Style.RESET_ALL}"
-        return super().format(record)
+        # Color the level name for this output only; the record is shared with other handlers
+        levelname = record.levelname
+        record.levelname = self.COLORED_LEVELS.get(levelname, levelname)
+        try:
+            return super().format(record)
+        finally:
+            record.levelname = levelname
+
+class WorkerQueueHandler(QueueHandler):
+    """Queue records from worker threads so they never block on file/console I/O.
+
+    Records from the main thread are written directly, after the queue has been
+    drained, so they stay in order with the console output around them.
+    """
+
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue)
+        self.target_handlers = handlers
+
+    def emit(self, record):
+        if threading.current_thread() is threading.main_thread():
+            self.queue.join()
+            for handler in self.target_handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        else:
+            super().emit(record)
 
 class MigrationLogger:
     def __init__(self, log_file='migration.log', console_level=logging.INFO):
@@ -58,45 +88,58 @@ class MigrationLogger:
         )
         console_handler.setLevel(console_level)
         
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        # Worker threads only enqueue; a background listener does the formatting and I/O
+        self.log_queue = queue.Queue(-1)
+        self.listener = QueueListener(self.log_queue, file_handler, console_handler, respect_handler_level=True)
+        self.logger.addHandler(WorkerQueueHandler(self.log_queue, file_handler, console_handler))
+        self.listener.start()
+        atexit.register(self.listener.stop)
         
         self.progress = None
         self.current_task = None
     
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, *args):
+        self.logger.debug(message, *args)
+    
+    def info(self, message, *args):
+        self.logger.info(message, *args)
     
-    def info(self, message):
-        self.logger.info(message)
+    def warning(self, message, *args):
+        self.logger.warning(message, *args)
     
-    def warning(self, message):
-        self.logger.warning(message)
+    def error(self, message, *args):
+        self.logger.error(message, *args)
     
-    def error(self, message):
-        self.logger.error(message)
+    def critical(self, message, *args):
+        self.logger.critical(message, *args)
     
-    def critical(self, message):
-        self.logger.critical(message)
+    def flush(self):
+        """Wait until records queued by worker threads have been written (main thread only)"""
+        if threading.current_thread() is threading.main_thread():
+            self.log_queue.join()
     
     def success(self, message):
         """Print success message with green checkmark"""
+        self.flush()
         console.print(f"[green]✓[/green] {message}")
         self.logger.info(f"SUCCESS: {message}")
     
     def failure(self, message):
         """Print failure message with red X"""
+        self.flush()
         console.print(f"[red]✗[/red] {message}")
         self.logger.error(f"FAILURE: {message}")
     
     def section(self, title):
         """Print a section header"""
+        self.flush()
         console.print()
         console.print(Panel(f"[bold cyan]{title}[/bold cyan]", expand=False))
         self.logger.info(f"=== {title} ===")
     
     def subsection(self, title):
         """Print a subsection header"""
+        self.flush()
         console.print(f"\n[bold yellow]→ {title}[/bold yellow]")
         self.logger.info(f"--- {title} ---")
     
@@ -109,11 +152,13 @@ class MigrationLogger:
         for key, value in stats_dict.items():
             table.add_row(key, str(value))
         
+        self.flush()
         console.print(table)
         self.logger.info(f"Stats - {title}: {stats_dict}")
     
     def print_summary(self, items, title="Summary"):
         """Print a summary list"""
+        self.flush()
         console.print(f"\n[bold]{title}:[/bold]")
         for item in items:
             console.print(f"  • {item}")
@@ -162,11 +207,11 @@ class MigrationLogger:
 
 _logger_instance = None
 
-def get_logger():
-    """Get or create singleton logger instance"""
+def get_logger(log_file='migration.log'):
+    """Get or create singleton logger instance (log_file only applies on creation)"""
     global _logger_instance
     if _logger_instance is None:
-        _logger_instance = MigrationLogger()
+        _logger_instance = MigrationLogger(log_file=log_file)
     return _logger_instance
 
 def log(message, level='info'):
@@ -196,4 +241,14 @@ def log_subsection(title):
 
 def log_stats(title, stats):
     """Log statistics"""
-    get_logger().print_stats(title, stats)
\ No newline at end of file
+    get_logger().print_stats(title, stats)
+
+def log_detailed_api_call(method, url, headers=None, data=None):
+    """Log all details of a failed API call (debug level, compact JSON, Authorization redacted)."""
+    logger = get_logger()
+    logger.debug("API CALL: %s %s", method, url)
+    if headers:
+        redacted = {key: '[REDACTED]' if key.lower() == 'authorization' else value for key, value in headers.items()}
+        logger.debug("Headers: %s", json.dumps(redacted, separators=(',', ':')))
+    if data:
+        logger.debug("Data Payload: %s", json.dumps(data, separators=(',', ':')))
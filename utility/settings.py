@@ -0,0 +1,61 @@
+import os
+from functools import lru_cache
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+# Boolean flags read from the environment (see .env.example)
+MIGRATION_FLAGS = (
+    "MIGRATE_TENANTS",
+    "MIGRATE_CATEGORIES",
+    "MIGRATE_PERMISSIONS",
+    "MIGRATE_ROLES",
+    "MIGRATE_USERS",
+    "MIGRATE_USER_ROLES",
+    "BULK_INVITE_USERS_TO_TENANTS",
+    "ASSIGN_ROLES_TO_USERS_ON_ALL_TENANTS",
+    "MIGRATE_GROUPS",
+    "MIGRATE_APPLICATIONS",
+    "MIGRATE_SECURITY_RULES",
+    "MIGRATE_EMAIL_TEMPLATES",
+    "MIGRATE_EMAIL_SENDER",
+    "MIGRATE_PREHOOKS",
+    "MIGRATE_ALLOWED_ORIGINS",
+)
+
+DELETION_FLAGS = (
+    "DELETE_TENANTS",
+    "DELETE_USERS",
+    "DELETE_PERMISSIONS",
+    "DELETE_ROLES",
+    "DELETE_APPLICATIONS",
+    "DELETE_PREHOOKS",
+)
+
+# Resources delete_account_data.py rate-limits, each read from RATE_<RESOURCE>_QPS
+RATE_LIMITED_RESOURCES = ("users", "tenants", "permissions", "roles", "applications", "prehooks")
+
+def env_flag(name, default="False"):
+    """Read a boolean flag from the environment."""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes")
+
+@lru_cache(maxsize=1)
+def get_settings():
+    """Load .env once and return the parsed configuration.
+
+    Call get_settings.cache_clear() to re-read the environment.
+    """
+    load_dotenv()
+    return SimpleNamespace(
+        BASE_URL_1=os.getenv("BASE_URL_1"),
+        CLIENT_ID_1=os.getenv("CLIENT_ID_1"),
+        API_KEY_1=os.getenv("API_KEY_1"),
+        BASE_URL_2=os.getenv("BASE_URL_2"),
+        CLIENT_ID_2=os.getenv("CLIENT_ID_2"),
+        API_KEY_2=os.getenv("API_KEY_2"),
+        # MIGRATE_JWT_SETTINTS (with the old typo) is still honoured when the correct name is unset
+        MIGRATE_JWT_SETTINGS=env_flag("MIGRATE_JWT_SETTINGS", os.getenv("MIGRATE_JWT_SETTINTS", "False")),
+        DELETE_WORKERS=int(os.getenv("DELETE_WORKERS", "16")),
+        RATE_QPS={resource: float(os.getenv(f"RATE_{resource.upper()}_QPS", "20")) for resource in RATE_LIMITED_RESOURCES},
+        REFRESH_USERS_CACHE=env_flag("REFRESH_USERS_CACHE"),
+        **{flag: env_flag(flag) for flag in MIGRATION_FLAGS + DELETION_FLAGS},
+    )
@@ -1,15 +1,24 @@
 
+import json
 import os
-from dotenv import load_dotenv
+import threading
 from utility.logger import log, log_success, log_error, log_warning, log_section, log_subsection, log_stats
 
-# Load environment variables
-load_dotenv()
 
-# Constants from .env
-BASE_URL_1 = os.getenv("BASE_URL_1")
-BASE_URL_2 = os.getenv("BASE_URL_2")
-CLIENT_ID_1 = os.getenv("CLIENT_ID_1")
-API_KEY_1 = os.getenv("API_KEY_1")
-CLIENT_ID_2 = os.getenv("CLIENT_ID_2")
-API_KEY_2 = os.getenv("API_KEY_2")
+def write_private_json(path, data):
+    """Atomically write data as JSON to path, readable by the current user only.
+
+    The JSON goes to a 0600 temporary file that is then moved into place with os.replace,
+    so readers never see a partial file. Raises OSError on failure.
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise